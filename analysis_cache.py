@@ -0,0 +1,130 @@
+# Engine answers remembered by position, so a position that comes up again -
+# the start position after every New Game, popular openings - is answered
+# without searching. Entries are keyed by the position and the limits it was
+# searched with: a normalized FEN (placement, side to move, castling and en
+# passant; the move counters don't change the answer) or a Position.zobrist
+# key, plus a string such as 'stockfish time=0.1' naming engine and limits.
+#
+# The front is an in-memory LRU of ANALYSIS_CACHE_SIZE entries. With a path,
+# every entry is also written to a SQLite file, which backs up LRU misses and
+# survives restarts. If the file can't be opened or written - a read-only
+# deploy, a full disk - the cache carries on in memory only. Zobrist keys
+# come from a fixed seed (bitboard.py), so they stay valid on disk across
+# runs. Call clear() after changing the engine or its evaluation.
+import collections
+import functools
+import os
+import sqlite3
+import threading
+
+ANALYSIS_CACHE_SIZE = 10000
+
+# SQLite file for the process-wide cache, in the user's cache directory; set
+# TITAN_ANALYSIS_CACHE to move it, or to an empty string to keep the cache in
+# memory only
+ANALYSIS_CACHE_FILE = os.environ.get(
+    'TITAN_ANALYSIS_CACHE',
+    os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+                 'titan-chess', 'analysis.sqlite3'))
+
+def position_key(position):
+    """Normalized text key for a FEN string or a Zobrist key"""
+    if isinstance(position, int):
+        return f"{position:016x}"
+    return ' '.join(position.split()[:4])
+
+class AnalysisCache:
+    def __init__(self, size=ANALYSIS_CACHE_SIZE, path=None):
+        self.size = size
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self.db = sqlite3.connect(path, check_same_thread=False)
+                self.db.execute('CREATE TABLE IF NOT EXISTS analysis (key TEXT PRIMARY KEY, move TEXT)')
+                self.db.commit()
+            except (OSError, sqlite3.Error):
+                self._drop_db()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _drop_db(self):
+        # The file is unusable: keep going on the in-memory LRU alone
+        if self.db is not None:
+            try:
+                self.db.close()
+            except sqlite3.Error:
+                pass
+        self.db = None
+
+    def _remember(self, key, move):
+        self.entries[key] = move
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def get(self, position, limits):
+        """The move stored for position under limits, or None"""
+        key = f"{position_key(position)}|{limits}"
+        with self.lock:
+            move = self.entries.get(key)
+            if move is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return move
+            if self.db is not None:
+                try:
+                    row = self.db.execute('SELECT move FROM analysis WHERE key = ?', (key,)).fetchone()
+                except sqlite3.Error:
+                    self._drop_db()
+                    row = None
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, position, limits, move):
+        key = f"{position_key(position)}|{limits}"
+        with self.lock:
+            self._remember(key, move)
+            if self.db is not None:
+                try:
+                    self.db.execute('INSERT OR REPLACE INTO analysis VALUES (?, ?)', (key, move))
+                    self.db.commit()
+                except sqlite3.Error:
+                    self._drop_db()
+
+    def clear(self):
+        """Forget every entry, on disk too"""
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                try:
+                    self.db.execute('DELETE FROM analysis')
+                    self.db.commit()
+                except sqlite3.Error:
+                    self._drop_db()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'capacity': self.size,
+        }
+
+    def close(self):
+        self._drop_db()
+
+@functools.lru_cache(maxsize=None)
+def get_analysis_cache():
+    """The process-wide AnalysisCache, backed by ANALYSIS_CACHE_FILE when set"""
+    return AnalysisCache(ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_FILE or None)
@@ -0,0 +1,87 @@
+# Search benchmark: nodes and time for a fixed-depth search of the perft
+# reference positions, once with every search feature on and once with each
+# one switched off, so a change to the search shows up as a node count.
+#
+#   python bench.py                  depth 3, every feature
+#   python bench.py --depth 4 --features USE_QUIESCENCE
+#   python bench.py --workers 4      parallel search speedup instead
+#
+# With USE_MOVE_ORDERING off the quiescence search runs inside wide windows,
+# so that run takes a few minutes at depth 3.
+import argparse
+import time
+
+import chess_ai
+from chess_logic import board_from_fen
+from perft import REFERENCE_POSITIONS
+
+# Module-level switches in chess_ai that the benchmark compares
+FEATURES = ['USE_MOVE_ORDERING', 'USE_QUIESCENCE', 'USE_PVS', 'USE_NULL_MOVE', 'USE_LMR', 'USE_SEE']
+
+def search_nodes(fen, depth):
+    """(nodes, seconds, best move) for a fresh iterative-deepening search of fen to depth"""
+    board, turn, last_move = board_from_fen(fen)
+    chess_ai.transposition_table.clear()
+    chess_ai.eval_cache.clear()
+    chess_ai.pawn_cache.clear()
+    limits = chess_ai.SearchLimits(max_depth=depth)
+    start = time.perf_counter()
+    move, _, _ = chess_ai.iterative_deepening(board, turn, last_move, limits=limits)
+    return limits.nodes, time.perf_counter() - start, move
+
+def run(depth, features=FEATURES):
+    """Print nodes per position with all features on and with each one off
+
+    Returns {label: total nodes}, label 'all' for everything on.
+    """
+    configs = [('all', None)] + [(f'no {feature}', feature) for feature in features]
+    totals = {}
+    for label, disabled in configs:
+        if disabled is not None:
+            setattr(chess_ai, disabled, False)
+        try:
+            total_nodes, total_time = 0, 0.0
+            for name, fen, _ in REFERENCE_POSITIONS:
+                nodes, elapsed, _ = search_nodes(fen, depth)
+                total_nodes += nodes
+                total_time += elapsed
+                print(f"{label:24} {name:10} depth {depth}: {nodes:8} nodes {elapsed:7.2f}s")
+        finally:
+            if disabled is not None:
+                setattr(chess_ai, disabled, True)
+        totals[label] = total_nodes
+        print(f"{label:24} total: {total_nodes} nodes in {total_time:.2f}s ({total_nodes / max(total_time, 1e-9):,.0f} nps)")
+    for label, nodes in totals.items():
+        if label != 'all':
+            print(f"{label}: {nodes} nodes vs {totals['all']} with everything on ({nodes / totals['all']:.1f}x)")
+    return totals
+
+def run_parallel(depth, workers):
+    """Print the deterministic parallel speedup over one worker for each position"""
+    serial_total, parallel_total = 0.0, 0.0
+    for name, fen, _ in REFERENCE_POSITIONS:
+        board, turn, last_move = board_from_fen(fen)
+        result = chess_ai.parallel_speedup(board, workers, depth, last_move)
+        serial_total += result['serial_time']
+        parallel_total += result['parallel_time']
+        same = 'same move' if result['serial_move'] == result['parallel_move'] else 'different move'
+        print(f"{name:10} depth {depth}: 1 worker {result['serial_time']:6.2f}s, {workers} workers "
+              f"{result['parallel_time']:6.2f}s, speedup {result['speedup']:.2f}x ({same})")
+    chess_ai.shutdown_pool()
+    print(f"total speedup with {workers} workers: {serial_total / parallel_total:.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fixed-depth search node counts with and without each search feature")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--features', nargs='+', choices=FEATURES, default=FEATURES,
+                        help="switches to compare (default: all of them)")
+    parser.add_argument('--workers', type=int, help="measure parallel search speedup with this many workers")
+    args = parser.parse_args(argv)
+    if args.workers:
+        run_parallel(args.depth, args.workers)
+    else:
+        run(args.depth, args.features)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,268 @@
+# Bitboard tables and the bitboard-backed Position used by chess_logic.py.
+# Square index is row * 8 + col, with row 0 being black's back rank - the same
+# orientation as board[row][col] - so bit (row * 8 + col) of a mask is set when
+# that square is part of the set.
+import random
+
+from psqt import PSQT
+
+COLORS = ('white', 'black')
+PIECE_TYPES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+
+SQUARES = [(square >> 3, square & 7) for square in range(64)]
+
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, -1), (2, 1), (1, 2), (1, -2)]
+KING_OFFSETS = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+def square_index(row, col):
+    return row * 8 + col
+
+def _offset_mask(square, offsets):
+    row, col = SQUARES[square]
+    mask = 0
+    for r, c in offsets:
+        if 0 <= row + r < 8 and 0 <= col + c < 8:
+            mask |= 1 << square_index(row + r, col + c)
+    return mask
+
+# Attack tables, built once at import
+KNIGHT_ATTACKS = [_offset_mask(square, KNIGHT_OFFSETS) for square in range(64)]
+KING_ATTACKS = [_offset_mask(square, KING_OFFSETS) for square in range(64)]
+# Squares a pawn of the given colour attacks from each square
+PAWN_ATTACKS = {
+    'white': [_offset_mask(square, [(-1, -1), (-1, 1)]) for square in range(64)],
+    'black': [_offset_mask(square, [(1, -1), (1, 1)]) for square in range(64)],
+}
+
+def _ray(square, direction):
+    row, col = SQUARES[square]
+    r, c = direction
+    ray = []
+    row, col = row + r, col + c
+    while 0 <= row < 8 and 0 <= col < 8:
+        ray.append((row, col))
+        row, col = row + r, col + c
+    return tuple(ray)
+
+# Sliding-piece rays: for each square, one tuple of (row, col) per direction,
+# nearest square first. Move generation walks a ray until the first blocker.
+ROOK_RAYS = [tuple(_ray(square, direction) for direction in ROOK_DIRECTIONS) for square in range(64)]
+BISHOP_RAYS = [tuple(_ray(square, direction) for direction in BISHOP_DIRECTIONS) for square in range(64)]
+QUEEN_RAYS = [ROOK_RAYS[square] + BISHOP_RAYS[square] for square in range(64)]
+
+# Sliding attacks the classical way: each direction's full ray as a mask, cut
+# off beyond the nearest blocker by XOR-ing out the blocker's own ray. The
+# nearest blocker is the lowest set bit on rays that run towards higher
+# square indexes and the highest one on rays that run the other way.
+def _ray_mask(square, direction):
+    mask = 0
+    for row, col in _ray(square, direction):
+        mask |= 1 << square_index(row, col)
+    return mask
+
+RAY_MASKS = {direction: [_ray_mask(square, direction) for square in range(64)]
+             for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+ROOK_LINES = [(RAY_MASKS[direction], direction[0] * 8 + direction[1] > 0) for direction in ROOK_DIRECTIONS]
+BISHOP_LINES = [(RAY_MASKS[direction], direction[0] * 8 + direction[1] > 0) for direction in BISHOP_DIRECTIONS]
+
+def _slider_attacks(square, occupied, lines):
+    attacks = 0
+    for masks, towards_higher in lines:
+        ray = masks[square]
+        blockers = ray & occupied
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1 if towards_higher else blockers.bit_length() - 1
+            ray ^= masks[blocker]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(square, occupied):
+    return _slider_attacks(square, occupied, ROOK_LINES)
+
+def bishop_attacks(square, occupied):
+    return _slider_attacks(square, occupied, BISHOP_LINES)
+
+def queen_attacks(square, occupied):
+    return _slider_attacks(square, occupied, ROOK_LINES) | _slider_attacks(square, occupied, BISHOP_LINES)
+
+ROW_MASKS = [0xFF << (8 * row) for row in range(8)]
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+FILE_MASKS = [FILE_A << col for col in range(8)]
+FULL_BOARD = (1 << 64) - 1
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(mask):
+        return bin(mask).count('1')
+
+def lsb(mask):
+    """Index of the lowest set bit of a non-empty mask"""
+    return (mask & -mask).bit_length() - 1
+
+def iter_squares(mask):
+    """Yield the square index of every set bit, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+# Zobrist keys: one random 64-bit number per (colour, piece type, square), per
+# castling right, per en passant file and for black to move. A position's key
+# is the XOR of the numbers for everything in it, so a move updates it with a
+# few XORs. The seed is fixed so every process and every run agrees on keys.
+_zobrist_random = random.Random(0x2F1A7C3E)
+ZOBRIST_PIECES = {(color, piece_type): [_zobrist_random.getrandbits(64) for _ in range(64)]
+                  for color in COLORS for piece_type in PIECE_TYPES}
+ZOBRIST_CASTLING = {right: _zobrist_random.getrandbits(64) for right in 'KQkq'}
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+def castling_key(rights):
+    key = 0
+    for right in rights:
+        key ^= ZOBRIST_CASTLING[right]
+    return key
+
+# Every ordered subset of 'KQkq', which is all make_move ever produces
+CASTLING_KEYS = {rights: castling_key(rights) for rights in
+                 (''.join(right for i, right in enumerate('KQkq') if bits >> i & 1) for bits in range(16))}
+
+
+class BoardRow(list):
+    """One row of a Position; writes keep the position's bitboards in sync"""
+    __slots__ = ('position', 'row')
+
+    def __init__(self, position, row):
+        list.__init__(self, [None] * 8)
+        self.position = position
+        self.row = row
+
+    def __setitem__(self, col, piece):
+        square = self.row * 8 + col
+        old = list.__getitem__(self, col)
+        if old is not None:
+            self.position._remove_bit(old, square)
+        list.__setitem__(self, col, piece)
+        if piece is not None:
+            self.position._add_bit(piece, square)
+
+
+class Position(list):
+    """8x8 grid of Piece objects backed by per-piece and per-colour bitboards
+
+    position[row][col] reads and writes exactly like the old list-of-lists
+    board, so Piece.get_moves, get_valid_moves and both renderers keep working
+    unchanged, while the hot paths ask the masks instead of scanning 64 squares.
+    """
+    __slots__ = ('piece_masks', 'color_masks', 'piece_lists', 'kings', '_castling_rights',
+                 'turn', 'en_passant_file', 'zobrist', 'pawn_zobrist', 'psqt_score')
+
+    def __init__(self, grid=None, castling_rights='KQkq', turn='white'):
+        self.piece_masks = {(color, piece_type): 0 for color in COLORS for piece_type in PIECE_TYPES}
+        self.color_masks = {color: 0 for color in COLORS}
+        # Per-colour piece lists ({(row, col): piece}) and the king slot,
+        # so loops over a side visit at most 16 pieces instead of 64 squares
+        self.piece_lists = {color: {} for color in COLORS}
+        self.kings = {color: None for color in COLORS}
+        # Zobrist key of the position, kept up to date by every write below
+        self.zobrist = 0
+        # The same, over the pawns alone, for the pawn-structure cache
+        self.pawn_zobrist = 0
+        # Material + piece-square balance from white's side (psqt.PSQT)
+        self.psqt_score = 0
+        self._castling_rights = ''
+        # Rights still available, as in FEN ('KQkq', 'Kq', '', ...)
+        self.castling_rights = castling_rights
+        self.turn = 'white'
+        if turn == 'black':
+            self.flip_turn()
+        # File of a pawn that just moved two squares, when an enemy pawn stands
+        # next to it and could take it en passant; None otherwise
+        self.en_passant_file = None
+        list.__init__(self, [BoardRow(self, row) for row in range(8)])
+        if grid is not None:
+            for row in range(8):
+                for col in range(8):
+                    if grid[row][col] is not None:
+                        self[row][col] = grid[row][col]
+
+    def _add_bit(self, piece, square):
+        bit = 1 << square
+        self.piece_masks[(piece.color, piece.piece_type)] |= bit
+        self.color_masks[piece.color] |= bit
+        self.zobrist ^= ZOBRIST_PIECES[(piece.color, piece.piece_type)][square]
+        if piece.piece_type == 'pawn':
+            self.pawn_zobrist ^= ZOBRIST_PIECES[(piece.color, 'pawn')][square]
+        self.psqt_score += PSQT[(piece.color, piece.piece_type)][square]
+        self.piece_lists[piece.color][SQUARES[square]] = piece
+        if piece.piece_type == 'king':
+            self.kings[piece.color] = SQUARES[square]
+
+    def _remove_bit(self, piece, square):
+        bit = 1 << square
+        self.piece_masks[(piece.color, piece.piece_type)] &= ~bit
+        self.color_masks[piece.color] &= ~bit
+        self.zobrist ^= ZOBRIST_PIECES[(piece.color, piece.piece_type)][square]
+        if piece.piece_type == 'pawn':
+            self.pawn_zobrist ^= ZOBRIST_PIECES[(piece.color, 'pawn')][square]
+        self.psqt_score -= PSQT[(piece.color, piece.piece_type)][square]
+        del self.piece_lists[piece.color][SQUARES[square]]
+        if piece.piece_type == 'king' and self.kings[piece.color] == SQUARES[square]:
+            self.kings[piece.color] = None
+
+    @property
+    def castling_rights(self):
+        return self._castling_rights
+
+    @castling_rights.setter
+    def castling_rights(self, rights):
+        self.zobrist ^= CASTLING_KEYS[self._castling_rights] ^ CASTLING_KEYS[rights]
+        self._castling_rights = rights
+
+    def flip_turn(self):
+        self.turn = 'black' if self.turn == 'white' else 'white'
+        self.zobrist ^= ZOBRIST_BLACK_TO_MOVE
+
+    def set_en_passant_file(self, file):
+        if self.en_passant_file is not None:
+            self.zobrist ^= ZOBRIST_EN_PASSANT[self.en_passant_file]
+        if file is not None:
+            self.zobrist ^= ZOBRIST_EN_PASSANT[file]
+        self.en_passant_file = file
+
+    def compute_zobrist(self):
+        """The key rebuilt from scratch; always equal to self.zobrist"""
+        key = castling_key(self._castling_rights)
+        for color in COLORS:
+            for square, piece in self.piece_lists[color].items():
+                key ^= ZOBRIST_PIECES[(color, piece.piece_type)][square_index(*square)]
+        if self.turn == 'black':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant_file is not None:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_file]
+        return key
+
+    @property
+    def occupied(self):
+        return self.color_masks['white'] | self.color_masks['black']
+
+    def pieces(self, color, piece_type):
+        return self.piece_masks[(color, piece_type)]
+
+    def piece_squares(self, color):
+        """(row, col) of every piece of the given colour"""
+        return list(self.piece_lists[color])
+
+    def piece_list(self, color):
+        """((row, col), piece) for every piece of the given colour
+
+        A snapshot, so callers may make and unmake moves while iterating.
+        """
+        return list(self.piece_lists[color].items())
+
+    def king_square(self, color):
+        return self.kings[color]
@@ -0,0 +1,739 @@
+# Search and evaluation shared by both front ends: evaluate_board, a negamax
+# search with its transposition table, and the iterative-deepening driver that gives
+# the AI a time or node budget per move instead of a fixed depth.
+import atexit
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_logic import (
+    generate_legal_moves, is_in_check, make_move, unmake_move, make_null_move, unmake_null_move,
+    attackers_to,
+)
+from bitboard import (
+    KNIGHT_ATTACKS, KING_ATTACKS, ROW_MASKS, FILE_A, FILE_H, FILE_MASKS, FULL_BOARD, SQUARES,
+    PIECE_TYPES, bishop_attacks, rook_attacks, queen_attacks, iter_squares, lsb, popcount, square_index,
+)
+from eval_cache import HashCache
+from psqt import piece_value
+from transposition import TranspositionTable, SharedTranspositionTable, EXACT, LOWER, UPPER
+
+# --- Evaluation ---
+# Material and piece-square terms are kept current by the board itself
+# (Position.psqt_score). Mobility and king-zone pressure come from attack
+# masks: each piece's attacked squares as a bitboard, counted with popcount,
+# so no move lists are built. Mobility counts the same moves Piece.get_moves
+# would list (without en passant); the king zone is the king's square and its
+# neighbours, and the term counts enemy attacks landing in it.
+#
+# Whole evaluations are cached by Zobrist key in eval_cache, and the pawn
+# structure term by the pawns-only key in pawn_cache: the pawns rarely move
+# during a search, so that cache hits almost every time. Clear eval_cache
+# after changing a switch or weight below.
+USE_MOBILITY = True
+USE_KING_ZONE = False
+USE_PAWN_STRUCTURE = True
+USE_EVAL_CACHE = True
+MOBILITY_WEIGHT = 5
+KING_ZONE_WEIGHT = 8
+DOUBLED_PAWN_PENALTY = 10
+ISOLATED_PAWN_PENALTY = 15
+# Passed pawn bonus by how far the pawn has come (rank 2 = 1, ..., rank 7 = 6)
+PASSED_PAWN_BONUS = [0, 5, 10, 20, 35, 60, 100, 0]
+
+EVAL_CACHE_MB = 8
+PAWN_CACHE_MB = 1
+eval_cache = HashCache(EVAL_CACHE_MB)
+pawn_cache = HashCache(PAWN_CACHE_MB)
+
+ADJACENT_FILES = [(FILE_MASKS[col - 1] if col > 0 else 0) | (FILE_MASKS[col + 1] if col < 7 else 0)
+                  for col in range(8)]
+
+def _passed_mask(square, color):
+    # Squares on this and the adjacent files ahead of the pawn, where an enemy pawn would stop it
+    row, col = SQUARES[square]
+    rows = range(row) if color == 'white' else range(row + 1, 8)
+    mask = 0
+    for r in rows:
+        mask |= ROW_MASKS[r]
+    return mask & (FILE_MASKS[col] | ADJACENT_FILES[col])
+
+PASSED_MASKS = {color: [_passed_mask(square, color) for square in range(64)] for color in ('white', 'black')}
+
+def pawn_structure(board, color):
+    """Doubled, isolated and passed pawn score for color's pawns"""
+    pawns = board.pieces(color, 'pawn')
+    enemy_pawns = board.pieces('black' if color == 'white' else 'white', 'pawn')
+    score = 0
+    for col in range(8):
+        on_file = popcount(pawns & FILE_MASKS[col])
+        if on_file > 1:
+            score -= DOUBLED_PAWN_PENALTY * (on_file - 1)
+        if on_file and not pawns & ADJACENT_FILES[col]:
+            score -= ISOLATED_PAWN_PENALTY * on_file
+    for square in iter_squares(pawns):
+        if not PASSED_MASKS[color][square] & enemy_pawns:
+            row = square >> 3
+            score += PASSED_PAWN_BONUS[7 - row if color == 'white' else row]
+    return score
+
+def pawn_structure_term(board):
+    """White's pawn structure score minus black's, through pawn_cache"""
+    score = pawn_cache.probe(board.pawn_zobrist)
+    if score is None:
+        score = pawn_structure(board, 'white') - pawn_structure(board, 'black')
+        pawn_cache.store(board.pawn_zobrist, score)
+    return score
+
+def side_activity(board, color):
+    """(mobility, attacks on the enemy king zone) for color's pieces"""
+    own = board.color_masks[color]
+    enemy = 'black' if color == 'white' else 'white'
+    enemy_pieces = board.color_masks[enemy]
+    occupied = own | enemy_pieces
+    empty = ~occupied & FULL_BOARD
+    king = board.pieces(enemy, 'king')
+    zone = (KING_ATTACKS[lsb(king)] | king) if king else 0
+
+    mobility = 0
+    zone_attacks = 0
+    for piece_type, attacks_from in (('knight', None), ('bishop', bishop_attacks), ('rook', rook_attacks),
+                                     ('queen', queen_attacks), ('king', None)):
+        for square in iter_squares(board.pieces(color, piece_type)):
+            if piece_type == 'knight':
+                attacks = KNIGHT_ATTACKS[square]
+            elif piece_type == 'king':
+                attacks = KING_ATTACKS[square]
+            else:
+                attacks = attacks_from(square, occupied)
+            mobility += popcount(attacks & ~own)
+            zone_attacks += popcount(attacks & zone)
+
+    # Pawns all at once: pushes onto empty squares, captures onto enemy pieces
+    pawns = board.pieces(color, 'pawn')
+    if color == 'white':
+        single = (pawns >> 8) & empty
+        double = ((single & ROW_MASKS[5]) >> 8) & empty
+        left, right = (pawns & ~FILE_A) >> 9, (pawns & ~FILE_H) >> 7
+    else:
+        single = (pawns << 8) & empty
+        double = ((single & ROW_MASKS[2]) << 8) & empty
+        left, right = ((pawns & ~FILE_A) << 7) & FULL_BOARD, ((pawns & ~FILE_H) << 9) & FULL_BOARD
+    mobility += popcount(single) + popcount(double) + popcount(left & enemy_pieces) + popcount(right & enemy_pieces)
+    zone_attacks += popcount(left & zone) + popcount(right & zone)
+    return mobility, zone_attacks
+
+def evaluation_terms(board):
+    """Each weighted evaluation term from white's point of view, whether switched on or not"""
+    white_mobility, white_zone = side_activity(board, 'white')
+    black_mobility, black_zone = side_activity(board, 'black')
+    return {
+        'psqt': board.psqt_score,
+        'mobility': MOBILITY_WEIGHT * (white_mobility - black_mobility),
+        'king_zone': KING_ZONE_WEIGHT * (white_zone - black_zone),
+        'pawn_structure': pawn_structure_term(board),
+    }
+
+def evaluate_board(board):
+    if USE_EVAL_CACHE:
+        score = eval_cache.probe(board.zobrist)
+        if score is not None:
+            return score
+    score = board.psqt_score
+    if USE_PAWN_STRUCTURE:
+        score += pawn_structure_term(board)
+    if USE_MOBILITY or USE_KING_ZONE:
+        white_mobility, white_zone = side_activity(board, 'white')
+        black_mobility, black_zone = side_activity(board, 'black')
+        if USE_MOBILITY:
+            score += MOBILITY_WEIGHT * (white_mobility - black_mobility)
+        if USE_KING_ZONE:
+            score += KING_ZONE_WEIGHT * (white_zone - black_zone)
+    if USE_EVAL_CACHE:
+        eval_cache.store(board.zobrist, score)
+    return score
+
+def time_evaluation(boards, repeat=100):
+    """Seconds per evaluate_board call over boards with each term switched on alone
+
+    'psqt' is the cost with every optional term off; the other entries
+    include it. eval_cache is bypassed, pawn_cache is not.
+    Useful for deciding which terms earn their keep.
+    """
+    global USE_MOBILITY, USE_KING_ZONE, USE_PAWN_STRUCTURE, USE_EVAL_CACHE
+    saved = USE_MOBILITY, USE_KING_ZONE, USE_PAWN_STRUCTURE, USE_EVAL_CACHE
+    timings = {}
+    try:
+        for name, switches in (('psqt', (False, False, False)), ('mobility', (True, False, False)),
+                               ('king_zone', (False, True, False)), ('pawn_structure', (False, False, True)),
+                               ('all', (True, True, True))):
+            USE_MOBILITY, USE_KING_ZONE, USE_PAWN_STRUCTURE = switches
+            USE_EVAL_CACHE = False
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for board in boards:
+                    evaluate_board(board)
+            timings[name] = (time.perf_counter() - start) / (repeat * len(boards))
+    finally:
+        USE_MOBILITY, USE_KING_ZONE, USE_PAWN_STRUCTURE, USE_EVAL_CACHE = saved
+    return timings
+
+# Memory budget for the search's transposition table; it keeps its entries
+# between moves, so print transposition_table.stats() to see the hit rate
+TT_SIZE_MB = 64
+transposition_table = TranspositionTable(TT_SIZE_MB)
+
+# --- Static exchange evaluation ---
+# What a capture really wins once both sides have taken turns recapturing on
+# the target square, each always with its least valuable attacker and each
+# free to stop when carrying on would lose material. Sliders lined up behind
+# a capturer join in as it leaves (x-rays). With USE_SEE, quiescence and the
+# last ply of the main search skip captures that lose material, and move
+# ordering puts them after the quiet moves.
+USE_SEE = True
+
+def static_exchange(board, move):
+    """Material the side playing capture move can expect to win (negative if it loses)"""
+    start, end = move[0], move[1]
+    piece = board[start[0]][start[1]]
+    victim = board[end[0]][end[1]]
+    occupied = board.occupied & ~(1 << square_index(*start))
+    if victim is None and piece.piece_type == 'pawn' and start[1] != end[1]:
+        # En passant: the victim is beside the capturing pawn, not on the target square
+        victim = board[start[0]][end[1]]
+        occupied &= ~(1 << square_index(start[0], end[1]))
+    gains = [piece_value[victim.piece_type] if victim is not None else 0]
+    on_square = piece_value[piece.piece_type]
+    color = 'black' if piece.color == 'white' else 'white'
+
+    while True:
+        attackers = attackers_to(board, end, occupied)
+        for piece_type in PIECE_TYPES:
+            candidates = attackers & board.pieces(color, piece_type)
+            if candidates:
+                break
+        else:
+            break
+        # Each entry is what the side to recapture nets if the exchange stops after it
+        gains.append(on_square - gains[-1])
+        if max(-gains[-2], gains[-1]) < 0:
+            break
+        on_square = piece_value[piece_type]
+        occupied &= ~(candidates & -candidates)
+        color = 'black' if color == 'white' else 'white'
+
+    # Either side may decline to carry on, so fold back from the end
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+# --- Move ordering ---
+# Alpha-beta cuts off sooner the earlier it meets a good move, so each node
+# tries the transposition-table move first, then captures by MVV-LVA (most
+# valuable victim, then least valuable attacker), then the two killer moves
+# of its ply - quiet moves that caused a cutoff in a sibling node - then the
+# other quiet moves by their history score, and last any captures that static
+# exchange evaluation says lose material.
+#
+# Killers and history belong to one search (a MoveOrdering on its
+# SearchLimits), so searches running side by side on different threads never
+# see each other's.
+USE_MOVE_ORDERING = True
+
+MAX_PLY = 64
+
+def captured_piece(board, move):
+    """The piece move takes, or None; en passant takes the pawn beside the capturer"""
+    start, end = move[0], move[1]
+    victim = board[end[0]][end[1]]
+    if victim is None and start[1] != end[1] and board[start[0]][start[1]].piece_type == 'pawn':
+        victim = board[start[0]][end[1]]
+    return victim
+
+class MoveOrdering:
+    """Killer moves and history scores learnt during one search"""
+    def __init__(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        # (color, start, end) -> sum of depth * depth over the cutoffs it caused
+        self.history = {}
+
+    def is_killer(self, move, ply):
+        return move in self.killers[min(ply, MAX_PLY - 1)]
+
+    def record_cutoff(self, board, move, depth, ply):
+        """Remember a quiet move that refuted its position as a killer and in history"""
+        if captured_piece(board, move) is not None:
+            return
+        killers = self.killers[ply] if ply < MAX_PLY else None
+        if killers is not None and killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        key = (board[move[0][0]][move[0][1]].color, move[0], move[1])
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+def order_moves(board, moves, tt_move=None, ply=0, ordering=None):
+    """moves sorted best first; quiet moves by ordering's killers and history when given"""
+    killers = ordering.killers[ply] if ordering is not None and ply < MAX_PLY else (None, None)
+    history = ordering.history if ordering is not None else {}
+
+    def move_score(move):
+        if move == tt_move:
+            return 1 << 40
+        start, end = move[0], move[1]
+        attacker = board[start[0]][start[1]]
+        victim = captured_piece(board, move)
+        if victim is not None:
+            # Taking something worth at least the capturer can't lose material; otherwise ask SEE
+            if USE_SEE and piece_value[victim.piece_type] < piece_value[attacker.piece_type]:
+                exchange = static_exchange(board, move)
+                if exchange < 0:
+                    return -(1 << 32) + exchange
+            return (1 << 32) + 10 * piece_value[victim.piece_type] - piece_value[attacker.piece_type]
+        if move == killers[0]:
+            return (1 << 31) + 1
+        if move == killers[1]:
+            return 1 << 31
+        return history.get((attacker.color, start, end), 0)
+
+    return sorted(moves, key=move_score, reverse=True)
+
+# --- Quiescence search ---
+# At the horizon the search carries on through captures only, so a position is
+# never scored in the middle of an exchange. The side to move may stand pat on
+# the static evaluation instead of capturing, and a capture is skipped when
+# even winning the victim plus DELTA_MARGIN could not lift the score to alpha
+# (delta pruning).
+USE_QUIESCENCE = True
+DELTA_MARGIN = 200
+
+def capture_moves(board, color, last_move=None):
+    """Pseudo-legal captures for color, en passant and capturing promotions included"""
+    moves = []
+    for square, piece in board.piece_list(color):
+        for target in piece.get_moves(board, square, last_move):
+            if board[target[0]][target[1]] is not None or (piece.piece_type == 'pawn' and target[1] != square[1]):
+                moves.append((square, target))
+    return moves
+
+def quiescence(board, alpha, beta, color, last_move=None, limits=None):
+    """Captures-only negamax score for color, the side to move"""
+    if limits is not None:
+        limits.check()
+    stand_pat = evaluate_board(board) if color == 'white' else -evaluate_board(board)
+    # Captures are pseudo-legal: once a king has been taken there is nothing left to resolve
+    if not board.pieces('white', 'king') or not board.pieces('black', 'king'):
+        return stand_pat
+    if stand_pat >= beta:
+        return stand_pat
+    alpha = max(alpha, stand_pat)
+
+    best = stand_pat
+    enemy = 'black' if color == 'white' else 'white'
+    # Only captures here, so no killers or history: MVV-LVA and SEE decide
+    for move in order_moves(board, capture_moves(board, color, last_move)):
+        start, end = move
+        piece = board[start[0]][start[1]]
+        victim = board[end[0]][end[1]]
+        gain = piece_value[victim.piece_type] if victim is not None else piece_value['pawn']
+        if piece.piece_type == 'pawn' and end[0] in (0, 7):
+            gain += piece_value['queen'] - piece_value['pawn']
+        if stand_pat + gain + DELTA_MARGIN <= alpha:
+            continue
+        if USE_SEE and victim is not None and piece_value[victim.piece_type] < piece_value[piece.piece_type] \
+                and static_exchange(board, move) < 0:
+            continue
+
+        undo = make_move(board, move)
+        try:
+            score = -quiescence(board, -beta, -alpha, enemy, move, limits)
+        finally:
+            unmake_move(board, undo)
+        best = max(best, score)
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    return best
+
+# --- Negamax search ---
+# Scores are from the side to move's point of view, so one code path serves
+# both colours: a child's score is negated on the way back up. On top of
+# alpha-beta with the transposition table and move ordering:
+#   - principal variation search: after the first move, every move is searched
+#     with a zero window (alpha, alpha + 1) just to prove it is no better, and
+#     re-searched with the full window only when that proof fails;
+#   - null-move pruning: let the opponent move twice in a row at reduced
+#     depth; if we are still above beta, a real move would be too. Never when
+#     in check or with only pawns left, where passing can be the best move;
+#   - late move reductions: quiet moves far down the ordering are searched one
+#     ply shallower and only searched again at full depth if they beat alpha.
+# Each switch can be turned off on its own to measure it with bench.py.
+USE_PVS = True
+USE_NULL_MOVE = True
+USE_LMR = True
+
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3
+
+# Mate scores count down with the distance to mate, so a quicker mate scores higher
+MATE_SCORE = 1000000
+MATE_BOUND = MATE_SCORE - 1000
+
+# Endgame tablebases: a tablebase.Tablebase, set by the front ends when
+# Syzygy files are installed. Inside the tree, a position the tables cover
+# scores TB_WIN, 0 or -TB_WIN for the side to move (cursed wins and blessed
+# losses are draws under the fifty-move rule) and is not searched further;
+# search() takes the root move straight from the tables.
+tablebase = None
+TB_WIN = MATE_BOUND - 1000
+
+def has_non_pawn_material(board, color):
+    return any(board.pieces(color, piece_type) for piece_type in ('knight', 'bishop', 'rook', 'queen'))
+
+def _score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def _score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+def _search_move(board, move, index, depth, alpha, beta, color, limits, ply, reducible):
+    """Play move and return its negamax score for color, using PVS and LMR"""
+    enemy = 'black' if color == 'white' else 'white'
+    undo = make_move(board, move)
+    try:
+        if index == 0:
+            return -negamax(board, depth - 1, -beta, -alpha, enemy, move, limits, ply + 1)[0]
+        # Zero window with PVS; otherwise the full window and no re-search needed
+        low = -alpha - 1 if USE_PVS else -beta
+        score = None
+        if USE_LMR and reducible and depth >= LMR_MIN_DEPTH and index >= LMR_MIN_MOVES and not is_in_check(board, enemy):
+            score = -negamax(board, depth - 2, low, -alpha, enemy, move, limits, ply + 1)[0]
+            if score <= alpha:
+                return score
+        score = -negamax(board, depth - 1, low, -alpha, enemy, move, limits, ply + 1)[0]
+        if USE_PVS and alpha < score < beta:
+            score = -negamax(board, depth - 1, -beta, -alpha, enemy, move, limits, ply + 1)[0]
+        return score
+    finally:
+        unmake_move(board, undo)
+
+def negamax(board, depth, alpha, beta, color, last_move=None, limits=None, ply=0, null_allowed=True):
+    """(score, best move) for color, the side to move, searched depth plies"""
+    if depth <= 0 and USE_QUIESCENCE:
+        return quiescence(board, alpha, beta, color, last_move, limits), None
+    if limits is not None:
+        limits.check()
+    if tablebase is not None and ply and tablebase.covers(board):
+        wdl = tablebase.probe_wdl(board)
+        if wdl is not None:
+            return (TB_WIN if wdl > 1 else -TB_WIN if wdl < -1 else 0), None
+
+    in_check = is_in_check(board, color)
+    moves = generate_legal_moves(board, color, last_move)
+    if not moves:
+        return (-MATE_SCORE + ply if in_check else 0), None
+    if depth <= 0:
+        return (evaluate_board(board) if color == 'white' else -evaluate_board(board)), None
+
+    # A transposed position searched at least this deep answers directly, or
+    # narrows the window when only a bound is known
+    entry = transposition_table.probe(board.zobrist)
+    tt_move = None
+    if entry is not None:
+        tt_move = entry[4]
+        if entry[1] >= depth:
+            bound, score = entry[2], _score_from_tt(entry[3], ply)
+            if bound == EXACT:
+                return score, tt_move
+            if bound == LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score, tt_move
+
+    enemy = 'black' if color == 'white' else 'white'
+    if (USE_NULL_MOVE and null_allowed and depth >= NULL_MOVE_MIN_DEPTH and not in_check
+            and abs(beta) < MATE_BOUND and has_non_pawn_material(board, color)):
+        null_undo = make_null_move(board)
+        try:
+            score = -negamax(board, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, enemy,
+                             None, limits, ply + 1, False)[0]
+        finally:
+            unmake_null_move(board, null_undo)
+        if score >= beta:
+            return score, None
+
+    ordering = limits.ordering if USE_MOVE_ORDERING and limits is not None else None
+    if USE_MOVE_ORDERING:
+        moves = order_moves(board, moves, tt_move, ply, ordering)
+    alpha_start = alpha
+    best_score, best_move = -MATE_SCORE - 1, None
+    for index, move in enumerate(moves):
+        start, end = move[0], move[1]
+        quiet = board[end[0]][end[1]] is None and not (
+            board[start[0]][start[1]].piece_type == 'pawn' and (start[1] != end[1] or end[0] in (0, 7)))
+        victim = board[end[0]][end[1]]
+        if (USE_SEE and depth == 1 and index > 0 and not in_check and victim is not None
+                and piece_value[victim.piece_type] < piece_value[board[start[0]][start[1]].piece_type]
+                and static_exchange(board, move) < 0):
+            continue
+        reducible = quiet and not in_check and not (ordering is not None and ordering.is_killer(move, ply))
+        score = _search_move(board, move, index, depth, alpha, beta, color, limits, ply, reducible)
+        if score > best_score:
+            best_score, best_move = score, move
+        if score > alpha:
+            alpha = score
+        if alpha >= beta:
+            if ordering is not None:
+                ordering.record_cutoff(board, move, depth, ply)
+            break
+
+    if best_score <= alpha_start:
+        bound = UPPER
+    elif best_score >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    transposition_table.store(board.zobrist, depth, bound, _score_to_tt(best_score, ply), best_move)
+    return best_score, best_move
+
+# --- Iterative deepening ---
+# Search depth 1, 2, 3, ... and keep the result of the last depth that
+# finished. negamax counts nodes and watches the clock through a SearchLimits;
+# when the budget runs out it raises SearchAborted, every make_move on the way
+# back up is unmade, and the unfinished iteration is thrown away.
+
+class SearchAborted(Exception):
+    pass
+
+class SearchLimits:
+    """Budget for one search - seconds, nodes and/or depth - and its node count
+
+    check() is called once per node. The clock starts when the limits are made.
+    ordering holds the search's killers and history, fresh unless given.
+    """
+    def __init__(self, time_limit=None, node_limit=None, max_depth=64, ordering=None):
+        self.nodes = 0
+        self.ordering = ordering if ordering is not None else MoveOrdering()
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+
+    def check(self):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchAborted()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchAborted()
+
+def search_root(board, color, depth, moves, last_move=None, limits=None, store=True):
+    """Best (score, move) among the given root moves, searched depth plies
+
+    The score is from white's point of view, like evaluate_board. Pass
+    store=False when moves is only part of the legal moves, so the result
+    isn't recorded as the position's value.
+    """
+    alpha, beta = -MATE_SCORE - 1, MATE_SCORE + 1
+    best_score, best_move = None, None
+    for index, move in enumerate(moves):
+        score = _search_move(board, move, index, depth, alpha, beta, color, limits, 0, False)
+        if best_move is None or score > best_score:
+            best_score, best_move = score, move
+        alpha = max(alpha, score)
+    if store:
+        transposition_table.store(board.zobrist, depth, EXACT, _score_to_tt(best_score, 0), best_move)
+    return (best_score if color == 'white' else -best_score), best_move
+
+def deepen(board, color, moves, last_move, limits, store=True):
+    """Yield (depth, score, move) for each iteration over moves that finishes in budget
+
+    Depth 1 always runs to completion so there is a move whenever one exists.
+    """
+    moves = list(moves)
+    for depth in range(1, limits.max_depth + 1):
+        iteration_limits = limits if depth > 1 else SearchLimits(ordering=limits.ordering)
+        try:
+            score, move = search_root(board, color, depth, moves, last_move, iteration_limits, store)
+        except SearchAborted:
+            return
+        if iteration_limits is not limits:
+            limits.nodes += iteration_limits.nodes
+        yield depth, score, move
+        # The previous iteration's best move is searched first in the next one
+        moves.remove(move)
+        moves.insert(0, move)
+
+def iterative_deepening(board, color, last_move=None, time_limit=None, node_limit=None, max_depth=64, limits=None):
+    """Search color's move with a time limit (seconds) and/or a node limit
+
+    Returns (best_move, score, depth) from the deepest iteration that finished.
+    With neither limit set the search only stops at max_depth. Pass a
+    SearchLimits as limits to read its node count afterwards; its own
+    max_depth then applies.
+    """
+    moves = generate_legal_moves(board, color, last_move)
+    if len(moves) <= 1:
+        return (moves[0] if moves else None), None, 0
+
+    if limits is None:
+        limits = SearchLimits(time_limit, node_limit, max_depth)
+    if USE_MOVE_ORDERING:
+        moves = order_moves(board, moves)
+    best_move, best_score, completed = None, None, 0
+    for completed, best_score, best_move in deepen(board, color, moves, last_move, limits):
+        pass
+    return best_move, best_score, completed
+
+# --- Parallel root search ---
+# search() is the one entry point for "find me a move". With more than one
+# worker the legal root moves are dealt out round-robin, in move-ordering
+# order, to a ProcessPoolExecutor; each worker deepens its own share under the
+# same limits and reports every depth it finished. The answer comes from the
+# deepest depth every worker finished, so scores are only ever compared
+# between searches of equal depth.
+#
+# With SHARE_TT the workers also share one SharedTranspositionTable of
+# TT_SIZE_MB, so a position one worker has searched is a hit for the others.
+# It lives as long as the pool and keeps its entries between moves; both are
+# closed by shutdown_pool(), which also runs at exit.
+#
+# Deterministic mode ignores the time limit and has every worker start from
+# empty private tables, so the same position and limits always give the same
+# move.
+# Workers are separate processes: on platforms that spawn rather than fork,
+# the calling script must be importable without side effects, which the
+# pygame and Streamlit scripts are not - they keep to one worker.
+SEARCH_WORKERS = 1
+SHARE_TT = True
+
+_pool = None
+_pool_workers = 0
+_shared_table = None
+
+def _worker_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+        atexit.register(shutdown_pool)
+    return _pool
+
+def _shared_transposition_table():
+    global _shared_table
+    if _shared_table is None:
+        _shared_table = SharedTranspositionTable(TT_SIZE_MB)
+    return _shared_table
+
+def shutdown_pool():
+    """Stop the search workers and free the shared transposition table"""
+    global _pool, _pool_workers, _shared_table
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+        _pool_workers = 0
+    if _shared_table is not None:
+        _shared_table.close()
+        _shared_table = None
+
+def clear_search_state():
+    """Empty every table the search learns from, for reproducible results"""
+    transposition_table.clear()
+    eval_cache.clear()
+    pawn_cache.clear()
+
+def _search_share(board, color, moves, last_move, time_limit, node_limit, max_depth, deterministic,
+                  table=None):
+    # Runs in a worker process: deepen over one share of the root moves,
+    # probing the shared table when one is passed in
+    global transposition_table
+    if table is not None:
+        transposition_table = table
+    elif isinstance(transposition_table, SharedTranspositionTable):
+        transposition_table = TranspositionTable(TT_SIZE_MB)
+    if deterministic:
+        clear_search_state()
+        time_limit = None
+    limits = SearchLimits(time_limit, node_limit, max_depth)
+    results = [(score, move) for _, score, move in deepen(board, color, moves, last_move, limits, store=False)]
+    return results, limits.nodes
+
+def search(board, limits=None, last_move=None, workers=None, deterministic=False):
+    """Best move for the side to move (board.turn) within limits (a SearchLimits)
+
+    workers defaults to SEARCH_WORKERS; limits.nodes holds the total node
+    count afterwards, and limits.node_limit is shared out between workers.
+    """
+    if limits is None:
+        limits = SearchLimits()
+    if tablebase is not None:
+        result = tablebase.root_move(board, last_move)
+        if result is not None:
+            return result[0]
+    workers = workers or SEARCH_WORKERS
+    color = board.turn
+    if workers <= 1:
+        run_limits = limits
+        if deterministic:
+            clear_search_state()
+            run_limits = SearchLimits(None, limits.node_limit, limits.max_depth)
+        move = iterative_deepening(board, color, last_move, limits=run_limits)[0]
+        if run_limits is not limits:
+            limits.nodes += run_limits.nodes
+        return move
+
+    moves = generate_legal_moves(board, color, last_move)
+    if len(moves) <= 1:
+        return moves[0] if moves else None
+    if USE_MOVE_ORDERING:
+        moves = order_moves(board, moves)
+    workers = min(workers, len(moves))
+    node_limit = None if limits.node_limit is None else max(1, limits.node_limit // workers)
+    time_limit = None
+    if limits.deadline is not None:
+        time_limit = max(0.0, limits.deadline - time.perf_counter())
+    pool = _worker_pool(workers)
+    table = _shared_transposition_table() if SHARE_TT and not deterministic else None
+    futures = [pool.submit(_search_share, board, color, moves[i::workers], last_move,
+                           time_limit, node_limit, limits.max_depth, deterministic, table)
+               for i in range(workers)]
+    shares = [future.result() for future in futures]
+
+    limits.nodes += sum(nodes for _, nodes in shares)
+    depth = min(len(results) for results, _ in shares)
+    best_score, best_move = None, None
+    for results, _ in shares:
+        score, move = results[depth - 1]
+        if best_move is None or (score > best_score if color == 'white' else score < best_score):
+            best_score, best_move = score, move
+    return best_move
+
+def parallel_speedup(board, workers, max_depth=4, last_move=None):
+    """Time a fixed-depth search with one worker and with workers, in deterministic mode
+
+    Returns a dict with both times, their ratio and both chosen moves.
+    """
+    timings = {}
+    for count in (1, workers):
+        limits = SearchLimits(max_depth=max_depth)
+        start = time.perf_counter()
+        move = search(board, limits, last_move, workers=count, deterministic=True)
+        timings[count] = (time.perf_counter() - start, move, limits.nodes)
+    serial, parallel = timings[1], timings[workers]
+    return {
+        'serial_time': serial[0], 'parallel_time': parallel[0],
+        'speedup': serial[0] / parallel[0] if parallel[0] else 0.0,
+        'serial_move': serial[1], 'parallel_move': parallel[1],
+        'serial_nodes': serial[2], 'parallel_nodes': parallel[2],
+    }
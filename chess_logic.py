@@ -0,0 +1,588 @@
+# Chess rules shared by the pygame (Chessboard_Implementation.py) and
+# Streamlit (streamlit_chess.py) front ends.
+
+from bitboard import (
+    COLORS, PIECE_TYPES, Position, SQUARES, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_RAYS, BISHOP_RAYS, QUEEN_RAYS,
+    square_index, iter_squares, rook_attacks, bishop_attacks,
+)
+
+def is_within_boundaries(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+def is_valid_square(board, row, col, piece_color):
+    return 0 <= row < 8 and 0 <= col < 8 and (board[row][col] is None or board[row][col].color != piece_color)
+
+# Every move generator takes (board, square, color, last_move) so Piece can
+# dispatch through a table; only pawns look at last_move (for en passant).
+
+def pawn_moves(board, square, color, last_move=None):
+    valid_moves = []
+    row, col = square
+    direction = -1 if color == 'white' else 1
+    start_row = 6 if color == 'white' else 1
+
+    # Move forward
+    if is_valid_square(board, row + direction, col, color) and board[row + direction][col] is None:
+        valid_moves.append((row + direction, col))
+        # Check if it's at the starting position and can move two squares
+        if row == start_row and is_valid_square(board, row + 2 * direction, col, color) and board[row + direction][col] is None and board[row + 2*direction][col] is None:
+            valid_moves.append((row + 2 * direction, col))
+
+    # Capturing moves
+    for offset in [-1, 1]:
+        capture_col = col + offset
+        if 0 <= capture_col < 8:
+            capture_square = board[row + direction][capture_col]
+            if capture_square and capture_square.color != color:
+                valid_moves.append((row + direction, capture_col))
+            # En passant
+            elif board[row][capture_col] and board[row][capture_col].piece_type == 'pawn' and board[row][capture_col].color != color:
+                if color == 'white' and row == 3 or color == 'black' and row == 4:
+                    if last_move:
+                        last_move_start, last_move_end = last_move[0], last_move[1]
+                        if last_move_end == (row, capture_col) and abs(last_move_start[0] - last_move_end[0]) == 2:
+                            valid_moves.append((row + direction, capture_col))
+
+    return valid_moves
+
+def knight_moves(board, square, color, last_move=None):
+    valid_moves = []
+    row, col = square
+
+    # Possible knight moves relative to rows, col
+    possible_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, -1), (2, 1), (1, 2), (1, -2)]
+
+    # Adjusting coordinates accordingly
+    for r, c in possible_moves:
+        new_row = row + r
+        new_col = col + c
+
+        if is_valid_square(board, new_row, new_col, color):
+            valid_moves.append((new_row, new_col))
+
+    return valid_moves
+
+def slide_moves(board, color, rays):
+    valid_moves = []
+    for ray in rays:
+        for target in ray:
+            occupant = board[target[0]][target[1]]
+            if occupant is None:
+                valid_moves.append(target)
+            else:
+                if occupant.color != color:
+                    valid_moves.append(target)
+                break
+
+    return valid_moves
+
+def bishop_moves(board, square, color, last_move=None):
+    return slide_moves(board, color, BISHOP_RAYS[square[0] * 8 + square[1]])
+
+def rook_moves(board, square, color, last_move=None):
+    return slide_moves(board, color, ROOK_RAYS[square[0] * 8 + square[1]])
+
+def queen_moves(board, square, color, last_move=None):
+    # The rook rays followed by the bishop rays of the same square
+    return slide_moves(board, color, QUEEN_RAYS[square[0] * 8 + square[1]])
+
+def king_moves(board, square, color, last_move=None):
+    valid_moves = []
+    row, col = square
+    possible_moves = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+    for r, c in possible_moves:
+        new_row = row + r
+        new_col = col + c
+
+        if is_valid_square(board, new_row, new_col, color):
+            valid_moves.append((new_row, new_col))
+
+    return valid_moves
+
+MOVE_GENERATORS = {
+    'pawn': pawn_moves,
+    'knight': knight_moves,
+    'bishop': bishop_moves,
+    'rook': rook_moves,
+    'queen': queen_moves,
+    'king': king_moves,
+}
+
+class Piece:
+    """A (colour, type) pair. There is exactly one shared, immutable instance
+    per pair - Piece('rook', 'white') always returns the same object - so a
+    piece carries no square of its own; the board knows where it stands.
+    """
+    __slots__ = ('piece_type', 'color', 'generate')
+
+    def __new__(cls, piece_type, color):
+        return PIECES[(color, piece_type)]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('pieces are shared between squares and cannot be changed')
+
+    # Copies and pickles resolve back to the shared instance
+    def __reduce__(self):
+        return (Piece, (self.piece_type, self.color))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"Piece({self.piece_type!r}, {self.color!r})"
+
+    def get_moves(self, board, square, last_move=None):
+        return self.generate(board, square, self.color, last_move)
+
+def _create_piece(piece_type, color):
+    piece = object.__new__(Piece)
+    object.__setattr__(piece, 'piece_type', piece_type)
+    object.__setattr__(piece, 'color', color)
+    object.__setattr__(piece, 'generate', MOVE_GENERATORS[piece_type])
+    return piece
+
+PIECES = {(color, piece_type): _create_piece(piece_type, color) for color in COLORS for piece_type in PIECE_TYPES}
+
+def initialize_board():
+    back_rank = ['rook', 'knight', 'bishop', 'queen', 'king', 'bishop', 'knight', 'rook']
+    board = [
+        [Piece(piece_type, 'black') for piece_type in back_rank],
+        [Piece('pawn', 'black') for i in range(8)],
+        [None] * 8,
+        [None] * 8,
+        [None] * 8,
+        [None] * 8,
+        [Piece('pawn', 'white') for i in range(8)],
+        [Piece(piece_type, 'white') for piece_type in back_rank]
+    ]
+    return Position(board)
+
+# --- Make / unmake ---
+# Search and legality checks play moves on the real board and take them back
+# afterwards instead of deep-copying all 64 squares for every candidate move.
+# make_move returns an undo record; unmake_move(board, record) restores the
+# board exactly, including captured pieces, castling rights, the rook of a
+# castling move, en passant victims and promoted pawns. Both also keep the
+# board's side to move, en passant file and Zobrist key current.
+
+UCI_PROMOTIONS = {'q': 'queen', 'r': 'rook', 'b': 'bishop', 'n': 'knight'}
+PROMOTION_TYPES = ('queen', 'rook', 'bishop', 'knight')
+
+# Moving from or to one of these squares loses the listed castling rights
+CASTLING_SQUARES = {(7, 4): 'KQ', (7, 7): 'K', (7, 0): 'Q', (0, 4): 'kq', (0, 7): 'k', (0, 0): 'q'}
+
+def make_move(board, move):
+    """Play move ((row, col), (row, col)[, promotion]) in place and return its undo record"""
+    start, end = move[0], move[1]
+    promotion = move[2] if len(move) > 2 else 'queen'
+    piece = board[start[0]][start[1]]
+    captured = board[end[0]][end[1]]
+    captured_square = end
+    castling_rights = board.castling_rights
+    en_passant_file = board.en_passant_file
+
+    # En passant: a pawn moving diagonally onto an empty square
+    if piece.piece_type == 'pawn' and start[1] != end[1] and captured is None:
+        captured_square = (start[0], end[1])
+        captured = board[start[0]][end[1]]
+        board[start[0]][end[1]] = None
+
+    # Castling: the king moves two squares, the rook jumps over it
+    rook_move = None
+    if piece.piece_type == 'king' and abs(start[1] - end[1]) == 2:
+        rook_start = (start[0], 7 if end[1] > start[1] else 0)
+        rook_end = (start[0], 5 if end[1] > start[1] else 3)
+        board[rook_end[0]][rook_end[1]] = board[rook_start[0]][rook_start[1]]
+        board[rook_start[0]][rook_start[1]] = None
+        rook_move = (rook_start, rook_end)
+
+    board[start[0]][start[1]] = None
+    if piece.piece_type == 'pawn' and end[0] in (0, 7):
+        board[end[0]][end[1]] = Piece(promotion, piece.color)
+    else:
+        board[end[0]][end[1]] = piece
+
+    if castling_rights:
+        rights = castling_rights
+        for square in (start, end):
+            for right in CASTLING_SQUARES.get(square, ''):
+                rights = rights.replace(right, '')
+        board.castling_rights = rights
+
+    if piece.piece_type == 'pawn' and abs(start[0] - end[0]) == 2:
+        board.set_en_passant_file(en_passant_capturable(board, end))
+    elif en_passant_file is not None:
+        board.set_en_passant_file(None)
+    board.flip_turn()
+
+    return (piece, start, end, captured, captured_square, rook_move, castling_rights, en_passant_file)
+
+def unmake_move(board, undo):
+    """Take back a move played with make_move"""
+    piece, start, end, captured, captured_square, rook_move, castling_rights, en_passant_file = undo
+    board[end[0]][end[1]] = None
+    board[start[0]][start[1]] = piece
+
+    if captured is not None:
+        board[captured_square[0]][captured_square[1]] = captured
+
+    if rook_move is not None:
+        rook_start, rook_end = rook_move
+        board[rook_start[0]][rook_start[1]] = board[rook_end[0]][rook_end[1]]
+        board[rook_end[0]][rook_end[1]] = None
+
+    board.castling_rights = castling_rights
+    board.set_en_passant_file(en_passant_file)
+    board.flip_turn()
+
+def make_null_move(board):
+    """Pass the turn without moving, for null-move pruning; returns the undo record"""
+    en_passant_file = board.en_passant_file
+    board.set_en_passant_file(None)
+    board.flip_turn()
+    return en_passant_file
+
+def unmake_null_move(board, en_passant_file):
+    board.set_en_passant_file(en_passant_file)
+    board.flip_turn()
+
+def en_passant_capturable(board, square):
+    """File of the pawn that just moved two squares to square, if an enemy pawn
+    stands beside it; None otherwise, so the Zobrist key only changes when en
+    passant is really on"""
+    row, col = square
+    color = board[row][col].color
+    for c in (col - 1, col + 1):
+        if 0 <= c < 8:
+            neighbour = board[row][c]
+            if neighbour is not None and neighbour.piece_type == 'pawn' and neighbour.color != color:
+                return col
+    return None
+
+# --- Attack detection ---
+# "Is this square attacked?" is answered by looking outward from the square:
+# the knight, pawn and king tables against the attacker's masks, then each
+# rook and bishop ray up to its first blocker. No move lists are generated.
+
+def is_square_attacked(board, square, by_color):
+    index = square_index(*square)
+    defender = 'black' if by_color == 'white' else 'white'
+    if KNIGHT_ATTACKS[index] & board.pieces(by_color, 'knight'):
+        return True
+    # A defender's pawn on this square would attack exactly the squares an attacking pawn must stand on
+    if PAWN_ATTACKS[defender][index] & board.pieces(by_color, 'pawn'):
+        return True
+    if KING_ATTACKS[index] & board.pieces(by_color, 'king'):
+        return True
+
+    queens = board.pieces(by_color, 'queen')
+    for rays, sliders, mask in ((ROOK_RAYS, ('rook', 'queen'), board.pieces(by_color, 'rook') | queens),
+                                (BISHOP_RAYS, ('bishop', 'queen'), board.pieces(by_color, 'bishop') | queens)):
+        if not mask:
+            continue
+        for ray in rays[index]:
+            for row, col in ray:
+                occupant = board[row][col]
+                if occupant is not None:
+                    if occupant.color == by_color and occupant.piece_type in sliders:
+                        return True
+                    break
+    return False
+
+def attackers_to(board, square, occupied):
+    """Mask of every piece, of either colour, attacking square when only the
+    squares in occupied are filled - so removing a piece from occupied lets
+    the sliders behind it through (for static exchange evaluation)"""
+    index = square_index(*square)
+    pieces = board.piece_masks
+    queens = pieces[('white', 'queen')] | pieces[('black', 'queen')]
+    attackers = (KNIGHT_ATTACKS[index] & (pieces[('white', 'knight')] | pieces[('black', 'knight')])
+                 | KING_ATTACKS[index] & (pieces[('white', 'king')] | pieces[('black', 'king')])
+                 | PAWN_ATTACKS['black'][index] & pieces[('white', 'pawn')]
+                 | PAWN_ATTACKS['white'][index] & pieces[('black', 'pawn')]
+                 | rook_attacks(index, occupied) & (pieces[('white', 'rook')] | pieces[('black', 'rook')] | queens)
+                 | bishop_attacks(index, occupied) & (pieces[('white', 'bishop')] | pieces[('black', 'bishop')] | queens))
+    return attackers & occupied
+
+def is_in_check(board, color):
+    king_position = board.king_square(color)
+    if king_position is None:
+        return False
+    return is_square_attacked(board, king_position, 'black' if color == 'white' else 'white')
+
+# Utility function to check if a move is legal
+def is_legal_move(board, start, target_position, last_move=None):
+    color = board[start[0]][start[1]].color
+    undo = make_move(board, (start, target_position))
+    in_check = is_in_check(board, color)
+    unmake_move(board, undo)
+    return not in_check
+
+# --- Legal move generation ---
+# Pins and checks are worked out once per position by walking the eight rays
+# out of the king, so most moves are accepted or rejected by a set lookup.
+# King moves are checked with is_square_attacked; only en passant (which can
+# uncover a check along the rank) is still played out with make/unmake.
+
+def get_pins_and_checks(board, color):
+    """Return (checkers, block_squares, pins) for the king of the given colour
+
+    checkers lists the squares of enemy pieces giving check, block_squares the
+    squares a non-king move must land on to answer a single check, and pins
+    maps the square of each pinned piece to the squares it may still move to.
+    """
+    checkers = []
+    block_squares = set()
+    pins = {}
+    king_position = board.king_square(color)
+    if king_position is None:
+        return checkers, block_squares, pins
+    enemy_color = 'black' if color == 'white' else 'white'
+    king = square_index(*king_position)
+
+    for index, ray in enumerate(QUEEN_RAYS[king]):
+        # QUEEN_RAYS holds the four rook rays first, then the bishop rays
+        sliders = ('rook', 'queen') if index < 4 else ('bishop', 'queen')
+        pinned = None
+        for distance, (row, col) in enumerate(ray):
+            occupant = board[row][col]
+            if occupant is None:
+                continue
+            if occupant.color == color:
+                if pinned is not None:
+                    break
+                pinned = (row, col)
+                continue
+            if occupant.piece_type in sliders:
+                line = ray[:distance + 1]
+                if pinned is None:
+                    checkers.append((row, col))
+                    block_squares.update(line)
+                else:
+                    pins[pinned] = set(line)
+            break
+
+    leapers = (KNIGHT_ATTACKS[king] & board.pieces(enemy_color, 'knight')) | (PAWN_ATTACKS[color][king] & board.pieces(enemy_color, 'pawn'))
+    for square in iter_squares(leapers):
+        checkers.append(SQUARES[square])
+        block_squares.add(SQUARES[square])
+
+    return checkers, block_squares, pins
+
+def legal_targets(board, square, piece, checks, last_move=None):
+    """Legal destinations of the piece on square, given get_pins_and_checks for its side"""
+    checkers, block_squares, pins = checks
+    moves = piece.get_moves(board, square, last_move)
+    if piece.piece_type == 'king':
+        # Lift the king off so it cannot hide behind itself from a slider
+        row, col = square
+        enemy_color = 'black' if piece.color == 'white' else 'white'
+        board[row][col] = None
+        legal_moves = [move for move in moves if not is_square_attacked(board, move, enemy_color)]
+        board[row][col] = piece
+        return legal_moves
+    # Only the king can answer a double check
+    if len(checkers) > 1:
+        return []
+
+    pin_line = pins.get(square)
+    legal_moves = []
+    for move in moves:
+        if piece.piece_type == 'pawn' and move[1] != square[1] and board[move[0]][move[1]] is None:
+            if is_legal_move(board, square, move, last_move):
+                legal_moves.append(move)
+            continue
+        if checkers and move not in block_squares:
+            continue
+        if pin_line is not None and move not in pin_line:
+            continue
+        legal_moves.append(move)
+    return legal_moves
+
+def get_valid_moves(board, square, last_move=None):
+    # Only return moves that do not leave own king in check
+    piece = board[square[0]][square[1]]
+    return legal_targets(board, square, piece, get_pins_and_checks(board, piece.color), last_move)
+
+def generate_legal_moves(board, color, last_move=None, underpromotions=False):
+    """Every legal move for color as (start, end) pairs, castling included
+
+    Pawn moves to the last rank promote to a queen; with underpromotions=True
+    they are listed once per piece instead, as (start, end, promotion).
+    """
+    checks = get_pins_and_checks(board, color)
+    moves = []
+    for square, piece in board.piece_list(color):
+        targets = legal_targets(board, square, piece, checks, last_move)
+        if underpromotions and piece.piece_type == 'pawn' and square[0] in (1, 6):
+            for move in targets:
+                if move[0] in (0, 7):
+                    moves.extend([(square, move, promotion) for promotion in PROMOTION_TYPES])
+                else:
+                    moves.append((square, move))
+            continue
+        moves.extend([(square, move) for move in targets])
+        if piece.piece_type == 'king' and not checks[0]:
+            moves.extend([(square, move) for move in get_castling_moves(board, square)])
+    return moves
+
+def has_legal_move(board, color, last_move=None):
+    checks = get_pins_and_checks(board, color)
+    for square, piece in board.piece_list(color):
+        if legal_targets(board, square, piece, checks, last_move):
+            return True
+    return False
+
+def is_checkmate(board, color, last_move=None):
+    """Check if the current player is in checkmate"""
+    return is_in_check(board, color) and not has_legal_move(board, color, last_move)
+
+def is_stalemate(board, color, last_move=None):
+    """Check if the current player is in stalemate"""
+    return not is_in_check(board, color) and not has_legal_move(board, color, last_move)
+
+def get_all_valid_moves(board, color, last_move=None):
+    moves = []
+    for square, piece in board.piece_list(color):
+        moves.extend([(square, move) for move in piece.get_moves(board, square, last_move)])
+    return moves
+
+def can_castle(board, king_position, rook_position):
+    y, king_x = king_position
+    rook_x = rook_position[1]
+    king = board[y][king_x]
+    rook = board[y][rook_x]
+    if king is None or king.piece_type != 'king' or rook is None or rook.piece_type != 'rook':
+        return False
+    if king.color != rook.color:
+        return False
+    # The castling rights remember whether the king or this rook has moved
+    right = CASTLING_SQUARES.get((y, rook_x))
+    if right is None or right not in board.castling_rights or right not in CASTLING_SQUARES.get(king_position, ''):
+        return False
+
+    # Check if squares between king and rook are empty
+    if rook_x == 0:  # Queen-side castling
+        for x in range(1, king_x):
+            if board[y][x] is not None:
+                return False
+    elif rook_x == 7:  # King-side castling
+        for x in range(king_x + 1, 7):
+            if board[y][x] is not None:
+                return False
+
+    # Check if squares the king passes through are under attack
+    if rook_x == 0:  # Queen-side castling
+        squares_to_check = [(y, king_x), (y, king_x - 1), (y, king_x - 2)]
+    elif rook_x == 7:  # King-side castling
+        squares_to_check = [(y, king_x), (y, king_x + 1), (y, king_x + 2)]
+
+    for square in squares_to_check:
+        if is_square_under_attack(board, square, king.color):
+            return False
+
+    return True
+
+def is_square_under_attack(board, square, color):
+    enemy_color = 'black' if color == 'white' else 'white'
+    return is_square_attacked(board, square, enemy_color)
+
+def get_castling_moves(board, king_position):
+    castling_moves = []
+    y = king_position[0]
+    if can_castle(board, king_position, (y, 0)):
+        castling_moves.append((y, 2))  # Queen-side
+    if can_castle(board, king_position, (y, 7)):
+        castling_moves.append((y, 6))  # King-side
+    return castling_moves
+
+def board_to_fen(board, turn, castling_rights='KQkq', en_passant='-', halfmove_clock=0, fullmove_number=1):
+    piece_to_fen = {
+        ('white', 'pawn'): 'P',
+        ('white', 'rook'): 'R',
+        ('white', 'knight'): 'N',
+        ('white', 'bishop'): 'B',
+        ('white', 'queen'): 'Q',
+        ('white', 'king'): 'K',
+        ('black', 'pawn'): 'p',
+        ('black', 'rook'): 'r',
+        ('black', 'knight'): 'n',
+        ('black', 'bishop'): 'b',
+        ('black', 'queen'): 'q',
+        ('black', 'king'): 'k',
+    }
+    fen_rows = []
+    occupied = board.occupied
+    for row_index, row in enumerate(board):
+        # Empty rows come straight from the occupancy mask
+        if not (occupied >> (row_index * 8)) & 0xFF:
+            fen_rows.append('8')
+            continue
+        fen_row = ''
+        empty = 0
+        for piece in row:
+            if piece is None:
+                empty += 1
+            else:
+                if empty > 0:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += piece_to_fen[(piece.color, piece.piece_type)]
+        if empty > 0:
+            fen_row += str(empty)
+        fen_rows.append(fen_row)
+    fen = '/'.join(fen_rows)
+    fen += ' ' + ('w' if turn == 'white' else 'b')
+    fen += f' {castling_rights if castling_rights else "-"}'
+    fen += f' {en_passant}'
+    fen += f' {halfmove_clock} {fullmove_number}'
+    return fen
+
+def board_from_fen(fen):
+    """Return (board, turn, last_move) for a FEN string
+
+    Move generation reads en passant rights from last_move, so a FEN en
+    passant square comes back as the double pawn push that created it.
+    """
+    fen_to_piece = {
+        'P': ('pawn', 'white'), 'R': ('rook', 'white'), 'N': ('knight', 'white'),
+        'B': ('bishop', 'white'), 'Q': ('queen', 'white'), 'K': ('king', 'white'),
+        'p': ('pawn', 'black'), 'r': ('rook', 'black'), 'n': ('knight', 'black'),
+        'b': ('bishop', 'black'), 'q': ('queen', 'black'), 'k': ('king', 'black'),
+    }
+    fields = fen.split()
+    castling = fields[2] if len(fields) > 2 else '-'
+    en_passant = fields[3] if len(fields) > 3 else '-'
+    turn = 'white' if len(fields) < 2 or fields[1] == 'w' else 'black'
+
+    board = Position(castling_rights='' if castling == '-' else castling, turn=turn)
+    for row, rank in enumerate(fields[0].split('/')):
+        col = 0
+        for char in rank:
+            if char.isdigit():
+                col += int(char)
+            else:
+                board[row][col] = Piece(*fen_to_piece[char])
+                col += 1
+
+    last_move = None
+    if en_passant != '-':
+        col = ord(en_passant[0]) - ord('a')
+        if en_passant[1] == '3':
+            last_move = ((6, col), (4, col))
+        else:
+            last_move = ((1, col), (3, col))
+        board.set_en_passant_file(en_passant_capturable(board, last_move[1]))
+    return board, turn, last_move
+
+def move_to_uci(move):
+    """((6, 4), (4, 4)) -> 'e2e4'; promotions get their piece letter"""
+    start, end = move[0], move[1]
+    uci = f"{chr(97 + start[1])}{8 - start[0]}{chr(97 + end[1])}{8 - end[0]}"
+    if len(move) > 2:
+        uci += {v: k for k, v in UCI_PROMOTIONS.items()}[move[2]]
+    return uci
@@ -0,0 +1,349 @@
+# Long-lived Stockfish processes shared by both front ends. Starting a UCI
+# engine costs far more than the 0.1 s search it is asked for, so the binary
+# is located once per process and each engine is kept open between moves.
+# The pool lives at module level, so in Streamlit - which imports modules once
+# per server - every session and rerun draws from the same engines.
+#
+# Engines are health-checked with a UCI ping when taken from the pool; one
+# that has died is replaced with a fresh process, and a search that fails
+# because its engine crashed is retried once on a new one.
+#
+# EngineService below does the same job on python-chess's asyncio API for
+# front ends serving many users at once: see its section.
+import asyncio
+import atexit
+import collections
+import concurrent.futures
+import functools
+import os
+import queue
+import shutil
+import threading
+import time
+
+import chess
+import chess.engine
+
+# Where to look for the binary, after the STOCKFISH_PATH environment variable
+# and before searching PATH
+STOCKFISH_CANDIDATES = ['/usr/local/bin/stockfish', '/usr/bin/stockfish', './stockfish']
+
+# Engines kept open, and the think time per move
+POOL_SIZE = 1
+MOVE_TIME = 0.1
+
+# Errors that mean an engine process is gone or no longer answering
+ENGINE_ERRORS = (chess.engine.EngineError, OSError, TimeoutError)
+
+@functools.lru_cache(maxsize=None)
+def find_stockfish():
+    """Path of the Stockfish binary, or None; looked up once per process"""
+    candidates = [os.environ.get('STOCKFISH_PATH')] + STOCKFISH_CANDIDATES + [shutil.which('stockfish')]
+    for path in candidates:
+        if path and os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+class EnginePool:
+    """Up to size UCI engines running path, opened on first use and reused after"""
+    def __init__(self, path, size=POOL_SIZE, open_engine=chess.engine.SimpleEngine.popen_uci):
+        self.path = path
+        self.size = size
+        self.open_engine = open_engine
+        # An empty slot is None until an engine is opened for it
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(None)
+        self.started = 0
+        self.restarts = 0
+
+    def _open(self):
+        self.started += 1
+        return self.open_engine(self.path)
+
+    def _discard(self, engine):
+        self.restarts += 1
+        try:
+            engine.close()
+        except ENGINE_ERRORS:
+            pass
+
+    def _acquire(self):
+        engine = self.idle.get()
+        if engine is not None:
+            try:
+                engine.ping()
+                return engine
+            except ENGINE_ERRORS:
+                self._discard(engine)
+        try:
+            return self._open()
+        except BaseException:
+            self.idle.put(None)
+            raise
+
+    def play(self, fen, limit):
+        """UCI string of the engine's move in fen, searched within limit (a chess.engine.Limit)"""
+        board = chess.Board(fen)
+        for attempt in range(2):
+            engine = self._acquire()
+            finished = False
+            try:
+                result = engine.play(board, limit)
+                finished = True
+            except ENGINE_ERRORS:
+                if attempt:
+                    raise
+                continue
+            finally:
+                # Whatever interrupted the search, the slot goes back; an
+                # engine that didn't finish may be mid-search, so it is replaced
+                if finished:
+                    self.idle.put(engine)
+                else:
+                    self.idle.put(None)
+                    self._discard(engine)
+            return result.move.uci() if result.move else None
+
+    def close(self):
+        """Quit every idle engine; engines out on a search are left alone"""
+        for _ in range(self.size):
+            try:
+                engine = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if engine is not None:
+                try:
+                    engine.quit()
+                except ENGINE_ERRORS:
+                    pass
+            self.idle.put(None)
+
+    def stats(self):
+        return {'size': self.size, 'started': self.started, 'restarts': self.restarts}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide EnginePool, or None when Stockfish isn't installed"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            path = find_stockfish()
+            if path is None:
+                return None
+            _pool = EnginePool(path)
+            atexit.register(_pool.close)
+        return _pool
+
+def stockfish_move(fen, move_time=MOVE_TIME):
+    """Stockfish's move in fen as a UCI string, or None without Stockfish"""
+    pool = get_pool()
+    if pool is None:
+        return None
+    return pool.play(fen, chess.engine.Limit(time=move_time))
+
+# --- Asyncio engine service ---
+# One event loop, on its own thread, drives every engine through the async
+# chess.engine API. Callers on any thread submit() a position and get a
+# concurrent.futures.Future back; a fixed number of worker coroutines, each
+# owning one engine process, take requests off a bounded queue in order.
+#
+# - Backpressure: when QUEUE_SIZE requests are already waiting, submit()
+#   raises EngineBusy straight away rather than letting work pile up.
+# - Each request carries its own think time, plus a deadline covering the
+#   time spent queued; past it the request is cancelled.
+# - Requests are tagged with a session; cancel_session() drops that
+#   session's queued requests and stops its search in progress, e.g. when
+#   the user starts a new game.
+# - stats() reports queue depth, throughput, rejections and wait times.
+QUEUE_SIZE = 16
+
+# Extra seconds a request may take beyond its think time, queueing included
+REQUEST_MARGIN = 2.0
+
+class EngineBusy(Exception):
+    """The request queue is full"""
+
+class EngineService:
+    def __init__(self, path, size=POOL_SIZE, queue_size=QUEUE_SIZE, popen=None):
+        self.path = path
+        self.size = size
+        self.queue_size = queue_size
+        self.popen = popen or chess.engine.popen_uci
+        # Requests submitted but not yet picked up by a worker, counted under
+        # a lock so submit() can refuse work without a trip through the loop
+        self.waiting = 0
+        self.waiting_lock = threading.Lock()
+        # The rest is only touched on the loop's thread: futures still in the
+        # queue, searches in progress, and each session's open requests
+        self.unstarted = set()
+        self.running = {}
+        self.interrupted = {}
+        self.sessions = collections.defaultdict(set)
+        self.counts = collections.Counter()
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='engine-service', daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _start(self):
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.ensure_future(self._worker()) for _ in range(self.size)]
+
+    def submit(self, fen, move_time=MOVE_TIME, session=None, timeout=None):
+        """concurrent.futures.Future for Stockfish's move in fen as a UCI string
+
+        timeout (default move_time + REQUEST_MARGIN) bounds queueing and
+        search together; past it the future raises TimeoutError. Raises
+        EngineBusy when the queue is full.
+        """
+        if timeout is None:
+            timeout = move_time + REQUEST_MARGIN
+        with self.waiting_lock:
+            if self.waiting >= self.queue_size:
+                self.counts['rejected'] += 1
+                raise EngineBusy(f"{self.waiting} engine requests already waiting")
+            self.waiting += 1
+        future = concurrent.futures.Future()
+        limit = chess.engine.Limit(time=move_time)
+        self.loop.call_soon_threadsafe(self._enqueue, fen, limit, session, timeout, future)
+        return future
+
+    def _enqueue(self, fen, limit, session, timeout, future):
+        self.counts['submitted'] += 1
+        self.unstarted.add(future)
+        self.sessions[session].add(future)
+        expiry = self.loop.call_later(timeout, self._interrupt, future, TimeoutError("engine request timed out"))
+        def finished(_):
+            expiry.cancel()
+            self.sessions[session].discard(future)
+            if not self.sessions[session]:
+                del self.sessions[session]
+        future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(finished, None))
+        self.queue.put_nowait((fen, limit, future, time.perf_counter()))
+
+    def _dequeue(self, future):
+        # future's request has left the queue, to a worker or by being dropped
+        if future in self.unstarted:
+            self.unstarted.discard(future)
+            with self.waiting_lock:
+                self.waiting -= 1
+
+    def _interrupt(self, future, error):
+        # Fail a request with error: stop its search, or drop it from the queue
+        if future.done():
+            return
+        self.counts['timed_out' if isinstance(error, TimeoutError) else 'cancelled'] += 1
+        if future in self.running:
+            self.interrupted[future] = error
+            self.running[future].cancel()
+        elif future.running():
+            # Taken by a worker that is still starting its engine
+            future.set_exception(error)
+        elif future.set_running_or_notify_cancel():
+            self._dequeue(future)
+            future.set_exception(error)
+
+    async def _worker(self):
+        engine = None
+        try:
+            while True:
+                engine = await self._serve(engine)
+        finally:
+            if engine is not None:
+                try:
+                    await asyncio.wait_for(engine.quit(), 1)
+                except ENGINE_ERRORS + (asyncio.TimeoutError,):
+                    pass
+
+    async def _serve(self, engine):
+        # Answer one request; returns the engine to use for the next
+        fen, limit, future, queued = await self.queue.get()
+        self._dequeue(future)
+        if future.done() or not future.set_running_or_notify_cancel():
+            return engine
+        self.counts['started'] += 1
+        waited = time.perf_counter() - queued
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        try:
+            if engine is None or engine.returncode.done():
+                if engine is not None:
+                    self.counts['restarts'] += 1
+                _, engine = await self.popen(self.path)
+            if future.done():
+                return engine
+            play = self.running[future] = asyncio.ensure_future(engine.play(chess.Board(fen), limit))
+            try:
+                await asyncio.wait([play])
+            finally:
+                del self.running[future]
+            if play.cancelled():
+                future.set_exception(self.interrupted.pop(future, concurrent.futures.CancelledError()))
+                return engine
+            move = play.result().move
+        except Exception as error:
+            # Whatever went wrong, the caller hears about it and the worker
+            # carries on; a dead engine is replaced on the next request
+            self.counts['failed'] += 1
+            if not future.done():
+                future.set_exception(error)
+            return engine
+        self.counts['completed'] += 1
+        future.set_result(move.uci() if move else None)
+        return engine
+
+    def cancel_session(self, session):
+        """Cancel every queued or running request of session"""
+        def cancel():
+            for future in list(self.sessions.get(session, ())):
+                self._interrupt(future, concurrent.futures.CancelledError())
+        self.loop.call_soon_threadsafe(cancel)
+
+    def stats(self):
+        started = self.counts['started']
+        return {
+            'queued': self.waiting,
+            'queue_size': self.queue_size,
+            'searching': len(self.running),
+            'workers': self.size,
+            'mean_wait': self.wait_total / started if started else 0.0,
+            'max_wait': self.wait_max,
+            **{name: self.counts[name] for name in
+               ('submitted', 'completed', 'rejected', 'cancelled', 'timed_out', 'failed', 'restarts')},
+        }
+
+    async def _stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    def close(self):
+        """Stop the workers, quitting their engines, and then the loop"""
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+_service = None
+
+def get_service():
+    """The process-wide EngineService, or None when Stockfish isn't installed"""
+    global _service
+    with _pool_lock:
+        if _service is None:
+            path = find_stockfish()
+            if path is None:
+                return None
+            _service = EngineService(path)
+            atexit.register(_service.close)
+        return _service
+
+def cancel_requests(session):
+    """Cancel session's engine requests, if the service is running"""
+    if _service is not None:
+        _service.cancel_session(session)
@@ -0,0 +1,41 @@
+# Bounded caches for evaluation results, indexed by a 64-bit Zobrist key.
+# Like the transposition table they are a fixed number of slots sized from a
+# megabyte budget; a new entry simply replaces whatever shares its slot, and
+# the full key is kept so a slot collision is never mistaken for a hit.
+
+# Rough CPython footprint of one (key, value) entry
+ENTRY_BYTES = 128
+
+class HashCache:
+    def __init__(self, size_mb=4):
+        slots = max(1, size_mb * 1024 * 1024 // ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.size_mb = size_mb
+        self.clear()
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """The value stored for key, or None"""
+        self.probes += 1
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def store(self, key, value):
+        self.slots[key & self.mask] = (key, value)
+
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'entries': sum(entry is not None for entry in self.slots),
+            'capacity': self.size,
+        }
@@ -0,0 +1,135 @@
+# Polyglot opening book, probed before any engine is asked for a move. A
+# Polyglot .bin file is a sorted array of 16-byte big-endian entries - key,
+# move, weight, learn - so the file is memory-mapped and the position's key
+# found by binary search; nothing is read into memory up front.
+#
+# Book keys are Polyglot's own Zobrist hash, not Position.zobrist: the same
+# scheme (pieces, castling, en passant file, side to move) over Polyglot's
+# published table of 781 random numbers, which python-chess ships. En passant
+# counts only when an enemy pawn stands beside the pawn that just moved, as
+# Position.en_passant_file already tracks.
+import functools
+import mmap
+import os
+import random
+import struct
+
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY
+
+from chess_logic import generate_legal_moves
+
+# Book used by the front ends; set TITAN_OPENING_BOOK to point elsewhere.
+# Without the file the book is simply skipped.
+BOOK_FILE = os.environ.get(
+    'TITAN_OPENING_BOOK', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin'))
+
+# 'weighted' picks among the book moves in proportion to their weights,
+# 'best' always plays the heaviest one
+BOOK_SELECTION = 'weighted'
+
+ENTRY = struct.Struct('>QHHI')
+
+# Polyglot numbers pieces black pawn, white pawn, black knight, ... white king
+POLYGLOT_PIECES = {(color, piece_type): 2 * kind + (color == 'white')
+                   for kind, piece_type in enumerate(['pawn', 'knight', 'bishop', 'rook', 'queen', 'king'])
+                   for color in ('black', 'white')}
+POLYGLOT_CASTLING = {'K': 768, 'Q': 769, 'k': 770, 'q': 771}
+POLYGLOT_EN_PASSANT = 772
+POLYGLOT_WHITE_TO_MOVE = 780
+POLYGLOT_PROMOTIONS = [None, 'knight', 'bishop', 'rook', 'queen']
+
+# A book castles by moving the king onto its own rook
+BOOK_CASTLING = {((7, 4), (7, 7)): (7, 6), ((7, 4), (7, 0)): (7, 2),
+                 ((0, 4), (0, 7)): (0, 6), ((0, 4), (0, 0)): (0, 2)}
+
+def polyglot_key(board):
+    """The Polyglot hash of board (a Position), with board.turn to move"""
+    key = 0
+    for row in range(8):
+        for col, piece in enumerate(board[row]):
+            if piece is not None:
+                kind = POLYGLOT_PIECES[(piece.color, piece.piece_type)]
+                key ^= POLYGLOT_RANDOM_ARRAY[64 * kind + 8 * (7 - row) + col]
+    for right in board.castling_rights:
+        key ^= POLYGLOT_RANDOM_ARRAY[POLYGLOT_CASTLING[right]]
+    if board.en_passant_file is not None:
+        key ^= POLYGLOT_RANDOM_ARRAY[POLYGLOT_EN_PASSANT + board.en_passant_file]
+    if board.turn == 'white':
+        key ^= POLYGLOT_RANDOM_ARRAY[POLYGLOT_WHITE_TO_MOVE]
+    return key
+
+def decode_move(bits):
+    """A book move as ((row, col), (row, col)[, promotion]), castling still as king-takes-rook"""
+    start = (7 - (bits >> 9 & 7), bits >> 6 & 7)
+    end = (7 - (bits >> 3 & 7), bits & 7)
+    promotion = POLYGLOT_PROMOTIONS[bits >> 12 & 7]
+    return (start, end, promotion) if promotion else (start, end)
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as book:
+            self.data = mmap.mmap(book.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data) // ENTRY.size
+
+    def entries(self, key):
+        """(move bits, weight) of every entry for key, in file order"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for index in range(low, self.size):
+            entry_key, move, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+        return found
+
+    def moves(self, board, last_move=None):
+        """The book's legal moves for board.turn as (move, weight) pairs"""
+        entries = self.entries(polyglot_key(board))
+        if not entries:
+            return []
+        legal = set(generate_legal_moves(board, board.turn, last_move, underpromotions=True))
+        found = []
+        for bits, weight in entries:
+            move = decode_move(bits)
+            piece = board[move[0][0]][move[0][1]]
+            if piece is not None and piece.piece_type == 'king' and move[:2] in BOOK_CASTLING:
+                move = (move[0], BOOK_CASTLING[move[:2]])
+            if move in legal:
+                found.append((move, weight))
+        return found
+
+    def choose(self, board, last_move=None, selection=None, rng=random):
+        """A book move for board.turn, or None once out of book"""
+        found = self.moves(board, last_move)
+        if not found:
+            return None
+        if (selection or BOOK_SELECTION) == 'best':
+            return max(found, key=lambda entry: entry[1])[0]
+        weights = [weight for _, weight in found]
+        if not any(weights):
+            return found[0][0]
+        return rng.choices([move for move, _ in found], weights)[0]
+
+    def close(self):
+        self.data.close()
+
+@functools.lru_cache(maxsize=None)
+def get_opening_book():
+    """The OpeningBook at BOOK_FILE, or None when there is no book; opened once per process"""
+    if os.path.isfile(BOOK_FILE) and os.path.getsize(BOOK_FILE):
+        return OpeningBook(BOOK_FILE)
+    return None
+
+def book_move(board, last_move=None):
+    """A move from the opening book for board.turn, or None"""
+    book = get_opening_book()
+    if book is None:
+        return None
+    return book.choose(board, last_move)
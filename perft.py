@@ -0,0 +1,152 @@
+# Perft: count the leaf nodes of the legal move tree to check and time the
+# move generator against published node counts.
+#
+#   python perft.py                         every reference position
+#   python perft.py --depth 4               deeper (slow in pure Python)
+#   python perft.py --fen "<fen>" --depth 3 --divide
+#   python perft.py --workers 4 --hash 64   root moves split across processes
+#                                           sharing one hash table of counts
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_logic import board_from_fen, generate_legal_moves, make_move, unmake_move, move_to_uci
+from transposition import SharedTranspositionTable, EXACT
+
+# (name, fen, {depth: nodes}) from the chessprogramming.org perft results
+REFERENCE_POSITIONS = [
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238}),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+]
+
+# Depth each reference position runs to when --depth isn't given
+DEFAULT_DEPTHS = {'start': 4, 'kiwipete': 3, 'position3': 4, 'position4': 3, 'position5': 3}
+
+# Subtree counts go in the table's score field, which holds 31 bits
+MAX_HASHED_COUNT = (1 << 31) - 1
+
+def perft(board, color, depth, last_move=None, table=None):
+    """Number of leaf nodes depth plies below the current position
+
+    With a table (a SharedTranspositionTable) subtree counts are stored
+    under the position's Zobrist key and reused when a transposition recurs.
+    """
+    if depth == 0:
+        return 1
+    if table is not None and depth > 1:
+        entry = table.probe(board.zobrist)
+        if entry is not None and entry[1] == depth:
+            return entry[3]
+    moves = generate_legal_moves(board, color, last_move, underpromotions=True)
+    if depth == 1:
+        return len(moves)
+    enemy = 'black' if color == 'white' else 'white'
+    nodes = 0
+    for move in moves:
+        undo = make_move(board, move)
+        nodes += perft(board, enemy, depth - 1, move, table)
+        unmake_move(board, undo)
+    if table is not None and nodes <= MAX_HASHED_COUNT:
+        table.store(board.zobrist, depth, EXACT, nodes, None)
+    return nodes
+
+def _perft_share(board, color, depth, moves, table):
+    # Runs in a worker process: {uci: nodes} for one share of the root moves
+    enemy = 'black' if color == 'white' else 'white'
+    counts = {}
+    for move in moves:
+        undo = make_move(board, move)
+        counts[move_to_uci(move)] = perft(board, enemy, depth - 1, move, table)
+        unmake_move(board, undo)
+    return counts
+
+def parallel_divide(board, color, depth, last_move=None, workers=2, hash_mb=0):
+    """divide() with the root moves dealt out to worker processes
+
+    With hash_mb the workers share one SharedTranspositionTable of that size.
+    """
+    moves = generate_legal_moves(board, color, last_move, underpromotions=True)
+    if depth < 1 or not moves:
+        return {}
+    table = SharedTranspositionTable(hash_mb) if hash_mb else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_perft_share, board, color, depth, moves[i::workers], table)
+                       for i in range(workers)]
+            counts = {}
+            for future in futures:
+                counts.update(future.result())
+    finally:
+        if table is not None:
+            table.close()
+    return counts
+
+def divide(board, color, depth, last_move=None):
+    """Perft split by root move, as {uci: nodes}, for diffing against another engine"""
+    enemy = 'black' if color == 'white' else 'white'
+    counts = {}
+    for move in generate_legal_moves(board, color, last_move, underpromotions=True):
+        undo = make_move(board, move)
+        counts[move_to_uci(move)] = perft(board, enemy, depth - 1, move)
+        unmake_move(board, undo)
+    return counts
+
+def run(fen, depth, expected=None, show_divide=False, name=None, workers=1, hash_mb=0):
+    """Time perft(depth) on fen and print nodes, nps and the check against expected
+
+    Returns True when the count matches (or nothing was expected).
+    """
+    board, turn, last_move = board_from_fen(fen)
+    start = time.perf_counter()
+    if workers > 1 or hash_mb:
+        counts = parallel_divide(board, turn, depth, last_move, workers, hash_mb)
+        if show_divide:
+            for uci in sorted(counts):
+                print(f"  {uci}: {counts[uci]}")
+        nodes = sum(counts.values()) if depth else 1
+    elif show_divide:
+        counts = divide(board, turn, depth, last_move)
+        for uci in sorted(counts):
+            print(f"  {uci}: {counts[uci]}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(board, turn, depth, last_move)
+    elapsed = time.perf_counter() - start
+    nps = nodes / elapsed if elapsed > 0 else 0
+    status = '' if expected is None else ('ok' if nodes == expected else f'MISMATCH (expected {expected})')
+    print(f"{name or fen} depth {depth}: {nodes} nodes in {elapsed:.2f}s ({nps:,.0f} nps) {status}")
+    return expected is None or nodes == expected
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts and timing for the move generator")
+    parser.add_argument('--fen', help="position to run instead of the reference set")
+    parser.add_argument('--depth', type=int, help="search depth (defaults per reference position)")
+    parser.add_argument('--divide', action='store_true', help="print the node count under each root move")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes to split the root moves across")
+    parser.add_argument('--hash', type=int, default=0, metavar='MB',
+                        help="shared hash table for subtree counts, in megabytes (default: none)")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        expected = None
+        for name, fen, counts in REFERENCE_POSITIONS:
+            if fen.split()[:4] == args.fen.split()[:4]:
+                expected = counts.get(args.depth or 1)
+        ok = run(args.fen, args.depth or 1, expected, args.divide, workers=args.workers, hash_mb=args.hash)
+    else:
+        ok = True
+        for name, fen, counts in REFERENCE_POSITIONS:
+            depth = args.depth or DEFAULT_DEPTHS[name]
+            ok = run(fen, depth, counts.get(depth), args.divide, name, args.workers, args.hash) and ok
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
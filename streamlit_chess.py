@@ -1,11 +1,28 @@
 import streamlit as st
 import numpy as np
-import copy
-import chess
-import chess.engine
-import os
-import subprocess
 import platform
+import uuid
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeout
+
+# Your exact chess logic from Chessboard_Implementation.py
+from chess_logic import (
+    initialize_board, get_valid_moves, make_move, is_in_check,
+    is_checkmate, board_to_fen, UCI_PROMOTIONS, move_to_uci,
+)
+import chess_ai
+from chess_ai import search, SearchLimits
+from engine_pool import get_service, cancel_requests, EngineBusy, MOVE_TIME, REQUEST_MARGIN
+from analysis_cache import get_analysis_cache
+from opening_book import book_move
+from tablebase import get_tablebase
+
+# Seconds the fallback AI may think per move; it plays the best move of the
+# deepest search that finished in time
+AI_TIME_LIMIT = 2.0
+
+# Syzygy tables in tablebase.SYZYGY_DIR, when installed, give the fallback AI
+# perfect endgame play
+chess_ai.tablebase = get_tablebase()
 
 # Configure Streamlit page
 st.set_page_config(
@@ -317,421 +334,68 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Your exact chess logic from Chessboard_Implementation.py
-def is_within_boundaries(row, col):
-    return 0 <= row < 8 and 0 <= col < 8
-
-def is_valid_square(board, row, col, piece_color):
-    return 0 <= row < 8 and 0 <= col < 8 and (board[row][col] is None or board[row][col].color != piece_color)
-
-def pawn_moves(board, piece, last_move=None):
-    valid_moves = []
-    row, col = piece.position
-    direction = -1 if piece.color == 'white' else 1
-    start_row = 6 if piece.color == 'white' else 1
-
-    # Move forward
-    if is_valid_square(board, row + direction, col, piece.color) and board[row + direction][col] is None:
-        valid_moves.append((row + direction, col))
-        # Check if it's at the starting position and can move two squares
-        if row == start_row and is_valid_square(board, row + 2 * direction, col, piece.color) and board[row + direction][col] is None and board[row + 2*direction][col] is None:
-            valid_moves.append((row + 2 * direction, col))
-
-    # Capturing moves
-    for offset in [-1, 1]:
-        capture_col = col + offset
-        if 0 <= capture_col < 8:
-            capture_square = board[row + direction][capture_col]
-            if capture_square and capture_square.color != piece.color:
-                valid_moves.append((row + direction, capture_col))
-            # En passant
-            elif board[row][capture_col] and board[row][capture_col].piece_type == 'pawn' and board[row][capture_col].color != piece.color:
-                if piece.color == 'white' and row == 3 or piece.color == 'black' and row == 4:
-                    if last_move:
-                        last_move_start, last_move_end = last_move
-                        if last_move_end == (row, capture_col) and abs(last_move_start[0] - last_move_end[0]) == 2:
-                            valid_moves.append((row + direction, capture_col))
-
-    return valid_moves
-
-def knight_moves(board, piece):
-    valid_moves = []
-    row, col = piece.position
-    possible_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, -1), (2, 1), (1, 2), (1, -2)]
-
-    for r, c in possible_moves:
-        new_row = row + r
-        new_col = col + c
-        if is_valid_square(board, new_row, new_col, piece.color):
-            valid_moves.append((new_row, new_col))
-
-    return valid_moves
-
-def bishop_moves(board, piece):
-    valid_moves = []
-    row, col = piece.position
-    possible_moves = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
-
-    for r, c in possible_moves:
-        new_row = row + r
-        new_col = col + c
-        while is_valid_square(board, new_row, new_col, piece.color):
-            if board[new_row][new_col] is None:
-                valid_moves.append((new_row, new_col))
-            elif board[new_row][new_col].color != piece.color:
-                valid_moves.append((new_row, new_col))
-                break
-            new_row = new_row + r
-            new_col = new_col + c
-
-    return valid_moves
-
-def rook_moves(board, piece):
-    valid_moves = []
-    row, col = piece.position
-    possible_moves = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-
-    for r, c in possible_moves:
-        new_row = row + r
-        new_col = col + c
-        while is_valid_square(board, new_row, new_col, piece.color):
-            if board[new_row][new_col] is None:
-                valid_moves.append((new_row, new_col))
-            elif board[new_row][new_col].color != piece.color:
-                valid_moves.append((new_row, new_col))
-                break
-            new_row = new_row + r
-            new_col = new_col + c
-
-    return valid_moves
-
-def queen_moves(board, piece):
-    valid_moves = []
-    row, col = piece.position
-    possible_moves = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
-
-    for r, c in possible_moves:
-        new_row = row + r
-        new_col = col + c
-        while is_valid_square(board, new_row, new_col, piece.color):
-            if board[new_row][new_col] is None:
-                valid_moves.append((new_row, new_col))
-            elif board[new_row][new_col].color != piece.color:
-                valid_moves.append((new_row, new_col))
-                break
-            new_row = new_row + r
-            new_col = new_col + c
-
-    return valid_moves
-
-def king_moves(board, piece):
-    valid_moves = []
-    row, col = piece.position
-    possible_moves = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
-
-    for r, c in possible_moves:
-        new_row = row + r
-        new_col = col + c
-        if is_valid_square(board, new_row, new_col, piece.color):
-            valid_moves.append((new_row, new_col))
-
-    return valid_moves
-
-class Piece:
-    def __init__(self, piece_type, color, position):
-        self.piece_type = piece_type
-        self.color = color
-        self.position = position
-        self.has_moved = False
-
-    def get_moves(self, board, last_move=None):
-        if self.piece_type == 'pawn':
-            return pawn_moves(board, self, last_move)
-        elif self.piece_type == 'knight':
-            return knight_moves(board, self)
-        elif self.piece_type == 'bishop':
-            return bishop_moves(board, self)
-        elif self.piece_type == 'rook':
-            return rook_moves(board, self)
-        elif self.piece_type == 'queen':
-            return queen_moves(board, self)
-        elif self.piece_type == 'king':
-            return king_moves(board, self)
-        else:
-            return []
-    
-    def update_position(self, new_position):
-        self.position = new_position
-        self.has_moved = True
-
-def is_in_check(board, color):
-    king_position = None
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece and piece.color == color and piece.piece_type == 'king':
-                king_position = (row, col)
-                break
-        if king_position:
-            break
-
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece and piece.color != color:
-                valid_moves = piece.get_moves(board)
-                if king_position in valid_moves:
-                    return True
-    return False
-
-def is_checkmate(board, color):
-    """Check if the current player is in checkmate"""
-    if not is_in_check(board, color):
-        return False
-    
-    # Check if any move can get out of check
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece and piece.color == color:
-                moves = get_valid_moves(piece, board)
-                for move in moves:
-                    temp_board = copy.deepcopy(board)
-                    temp_piece = temp_board[row][col]
-                    temp_piece.update_position(move)
-                    temp_board[move[0]][move[1]] = temp_piece
-                    temp_board[row][col] = None
-                    if not is_in_check(temp_board, color):
-                        return False
-    return True
-
-def is_stalemate(board, color):
-    """Check if the current player is in stalemate"""
-    if is_in_check(board, color):
-        return False
-    
-    # Check if any legal move exists
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece and piece.color == color:
-                moves = get_valid_moves(piece, board)
-                for move in moves:
-                    temp_board = copy.deepcopy(board)
-                    temp_piece = temp_board[row][col]
-                    temp_piece.update_position(move)
-                    temp_board[move[0]][move[1]] = temp_piece
-                    temp_board[row][col] = None
-                    if not is_in_check(temp_board, color):
-                        return False
-    return True
-
-def is_legal_move(board, piece, target_position, last_move=None):
-    original_position = piece.position
-    temp_board = copy.deepcopy(board)
-    temp_piece = temp_board[original_position[0]][original_position[1]]
-    temp_piece.update_position(target_position)
-    temp_board[target_position[0]][target_position[1]] = temp_piece
-    temp_board[original_position[0]][original_position[1]] = None
-    return not is_in_check(temp_board, piece.color)
-
-def get_valid_moves(piece, board, last_move=None):
-    moves = piece.get_moves(board, last_move)
-    legal_moves = []
-    for move in moves:
-        if is_legal_move(board, piece, move, last_move):
-            legal_moves.append(move)
-    return legal_moves
-
-def can_castle(board, king, rook):
-    if king.has_moved or rook.has_moved:
-        return False
-    if king.color != rook.color:
-        return False
-    y = king.position[0]
-    king_x = king.position[1]
-    rook_x = rook.position[1]
-
-    # Check if squares between king and rook are empty
-    if rook_x == 0:  # Queen-side castling
-        for x in range(1, king_x):
-            if board[y][x] is not None:
-                return False
-    elif rook_x == 7:  # King-side castling
-        for x in range(king_x + 1, 7):
-            if board[y][x] is not None:
-                return False
-
-    # Check if squares the king passes through are under attack
-    if rook_x == 0:  # Queen-side castling
-        squares_to_check = [(y, king_x), (y, king_x - 1), (y, king_x - 2)]
-    elif rook_x == 7:  # King-side castling
-        squares_to_check = [(y, king_x), (y, king_x + 1), (y, king_x + 2)]
-
-    for square in squares_to_check:
-        if is_square_under_attack(board, square, king.color):
-            return False
-
-    return True
-
-def is_square_under_attack(board, square, color):
-    enemy_color = 'black' if color == 'white' else 'white'
-    for row in board:
-        for piece in row:
-            if piece and piece.color == enemy_color:
-                if square in piece.get_moves(board):
-                    return True
-    return False
-
-def get_castling_moves(board, king):
-    castling_moves = []
-    y = king.position[0]
-    if king.color == 'white':
-        if can_castle(board, king, board[y][0]):
-            castling_moves.append((y, 2))  # Queen-side
-        if can_castle(board, king, board[y][7]):
-            castling_moves.append((y, 6))  # King-side
-    elif king.color == 'black':
-        if can_castle(board, king, board[y][0]):
-            castling_moves.append((y, 2))  # Queen-side
-        if can_castle(board, king, board[y][7]):
-            castling_moves.append((y, 6))  # King-side
-    return castling_moves
-
 # STOCKFISH INTEGRATION - EXACT SAME AS PYTHON VERSION
-def get_stockfish_path():
-    """Find Stockfish executable path"""
-    possible_paths = [
-        '/usr/local/bin/stockfish',  # Homebrew on Mac
-        '/usr/bin/stockfish',        # Linux
-        'stockfish',                 # In PATH
-        './stockfish',               # Local directory
-    ]
-    
-    for path in possible_paths:
-        try:
-            if os.path.exists(path) or path == 'stockfish':
-                # Test if it works
-                result = subprocess.run([path, 'quit'], 
-                                      capture_output=True, text=True, timeout=1)
-                return path
-        except:
-            continue
-    
-    return None
-
-def board_to_fen(board, turn, castling_rights='KQkq', en_passant='-', halfmove_clock=0, fullmove_number=1):
-    """Convert board to FEN string - EXACT SAME AS PYTHON"""
-    piece_to_fen = {
-        ('white', 'pawn'): 'P',
-        ('white', 'rook'): 'R',
-        ('white', 'knight'): 'N',
-        ('white', 'bishop'): 'B',
-        ('white', 'queen'): 'Q',
-        ('white', 'king'): 'K',
-        ('black', 'pawn'): 'p',
-        ('black', 'rook'): 'r',
-        ('black', 'knight'): 'n',
-        ('black', 'bishop'): 'b',
-        ('black', 'queen'): 'q',
-        ('black', 'king'): 'k',
-    }
-    fen_rows = []
-    for row in board:
-        fen_row = ''
-        empty = 0
-        for piece in row:
-            if piece is None:
-                empty += 1
-            else:
-                if empty > 0:
-                    fen_row += str(empty)
-                    empty = 0
-                fen_row += piece_to_fen[(piece.color, piece.piece_type)]
-        if empty > 0:
-            fen_row += str(empty)
-        fen_rows.append(fen_row)
-    fen = '/'.join(fen_rows)
-    fen += ' ' + ('w' if turn == 'white' else 'b')
-    fen += f' {castling_rights if castling_rights else "-"}'
-    fen += f' {en_passant}'
-    fen += f' {halfmove_clock} {fullmove_number}'
-    return fen
-
-def get_stockfish_move(board, color, castling_rights='KQkq', en_passant='-', halfmove_clock=0, fullmove_number=1):
-    """Get move from Stockfish - EXACT SAME AS PYTHON"""
+# Requests go through engine_pool's EngineService: one asyncio loop shared by
+# every session, feeding a few long-lived Stockfish processes from a bounded
+# queue. Each session tags its requests so New Game can cancel them.
+# Answers are kept in the analysis cache, so positions seen before by any
+# session (or an earlier run) are played instantly.
+def get_stockfish_move(board, color, castling_rights='KQkq', en_passant='-', halfmove_clock=0, fullmove_number=1, last_move=None):
+    """Get move from Stockfish - EXACT SAME AS PYTHON
+
+    None when the request was cancelled by a new game.
+    """
     try:
         fen = board_to_fen(board, color, castling_rights, en_passant, halfmove_clock, fullmove_number)
-        board_obj = chess.Board(fen)
-        
-        stockfish_path = get_stockfish_path()
-        if stockfish_path:
-            with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-                result = engine.play(board_obj, chess.engine.Limit(time=0.1))
-                move = result.move
-                return move.uci()  # e.g., 'e2e4'
-        else:
-            # Fallback to minimax if Stockfish not available
-            return get_minimax_move(board, color)
+        service = get_service()
+        if service:
+            cache = get_analysis_cache()
+            limits = f"stockfish time={MOVE_TIME}"
+            uci_move = cache.get(fen, limits)
+            if uci_move is None:
+                future = service.submit(fen, session=st.session_state.engine_session)
+                try:
+                    uci_move = future.result(timeout=MOVE_TIME + REQUEST_MARGIN)
+                finally:
+                    # Don't leave an abandoned request queued or searching
+                    if not future.done():
+                        cancel_requests(st.session_state.engine_session)
+                if uci_move:
+                    cache.put(fen, limits, uci_move)
+            if uci_move:
+                return uci_move  # e.g., 'e2e4'
+        # Fallback to minimax if Stockfish not available
+        return get_minimax_move(board, color, last_move)
+    except CancelledError:
+        return None
+    except FutureTimeout:
+        st.warning("Stockfish took too long. Using fallback AI.")
+        return get_minimax_move(board, color, last_move)
+    except EngineBusy:
+        st.warning("Stockfish is busy with other games. Using fallback AI.")
+        return get_minimax_move(board, color, last_move)
     except Exception as e:
         st.warning(f"Stockfish error: {e}. Using fallback AI.")
-        return get_minimax_move(board, color)
-
-def get_minimax_move(board, color):
-    """Fallback minimax AI - EXACT SAME AS PYTHON"""
-    best_move = None
-    best_score = float('-inf') if color == 'white' else float('inf')
-    
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece and piece.color == color:
-                moves = get_valid_moves(piece, board)
-                for move in moves:
-                    temp_board = copy.deepcopy(board)
-                    temp_piece = temp_board[row][col]
-                    temp_piece.update_position(move)
-                    temp_board[move[0]][move[1]] = temp_piece
-                    temp_board[row][col] = None
-                    
-                    score = evaluate_board(temp_board)
-                    if color == 'white':
-                        if score > best_score:
-                            best_score = score
-                            best_move = ((row, col), move)
-                    else:
-                        if score < best_score:
-                            best_score = score
-                            best_move = ((row, col), move)
-    
-    if best_move:
-        return f"{chr(97 + best_move[0][1])}{8 - best_move[0][0]}{chr(97 + best_move[1][1])}{8 - best_move[1][0]}"
-    return None
-
-def evaluate_board(board):
-    """Board evaluation - EXACT SAME AS PYTHON"""
-    piece_value = {
-        'pawn': 100,
-        'knight': 320,
-        'bishop': 330,
-        'rook': 500,
-        'queen': 900,
-        'king': 20000
-    }
-    
-    score = 0
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece:
-                if piece.color == 'white':
-                    score += piece_value[piece.piece_type]
-                else:
-                    score -= piece_value[piece.piece_type]
-    
-    return score
-
-def update_fen_state(board, move, piece, turn):
+        return get_minimax_move(board, color, last_move)
+
+def get_book_move(board, last_move=None):
+    """Move from the Polyglot opening book, or None when out of book"""
+    move = book_move(board, last_move)
+    return move_to_uci(move) if move else None
+
+def get_minimax_move(board, color, last_move=None):
+    """Fallback AI - the same iterative-deepening search as the Python version"""
+    cache = get_analysis_cache()
+    limits = f"titan time={AI_TIME_LIMIT}"
+    uci_move = cache.get(board.zobrist, limits)
+    if uci_move is None:
+        best_move = search(board, SearchLimits(time_limit=AI_TIME_LIMIT), last_move)
+        if best_move:
+            uci_move = move_to_uci(best_move)
+            cache.put(board.zobrist, limits, uci_move)
+    return uci_move
+
+def update_fen_state(board, start, move, piece, turn):
     """Update FEN state variables - EXACT SAME AS PYTHON"""
     global castling_rights, en_passant, halfmove_clock, fullmove_number
     
@@ -744,23 +408,23 @@ def update_fen_state(board, move, piece, turn):
     
     if piece.piece_type == 'rook':
         if piece.color == 'white':
-            if piece.position == (7, 0) or move == (7, 0):
+            if start == (7, 0) or move == (7, 0):
                 castling_rights = castling_rights.replace('Q', '')
-            if piece.position == (7, 7) or move == (7, 7):
+            if start == (7, 7) or move == (7, 7):
                 castling_rights = castling_rights.replace('K', '')
         else:
-            if piece.position == (0, 0) or move == (0, 0):
+            if start == (0, 0) or move == (0, 0):
                 castling_rights = castling_rights.replace('q', '')
-            if piece.position == (0, 7) or move == (0, 7):
+            if start == (0, 7) or move == (0, 7):
                 castling_rights = castling_rights.replace('k', '')
     
     if castling_rights == '':
         castling_rights = '-'
     
     # En passant
-    if piece.piece_type == 'pawn' and abs(move[0] - piece.position[0]) == 2:
+    if piece.piece_type == 'pawn' and abs(move[0] - start[0]) == 2:
         col = move[1]
-        row = (move[0] + piece.position[0]) // 2
+        row = (move[0] + start[0]) // 2
         en_passant = chr(col + ord('a')) + str(8 - row)
     else:
         en_passant = '-'
@@ -781,20 +445,6 @@ en_passant = '-'
 halfmove_clock = 0
 fullmove_number = 1
 
-# Initialize board
-def initialize_board():
-    board = [
-        [Piece('rook', 'black', (0, 0)), Piece('knight', 'black', (0, 1)), Piece('bishop', 'black', (0, 2)), Piece('queen', 'black', (0, 3)), Piece('king', 'black', (0, 4)), Piece('bishop', 'black', (0, 5)), Piece('knight', 'black', (0, 6)), Piece('rook', 'black', (0, 7))],
-        [Piece('pawn', 'black', (1, i)) for i in range(8)],
-        [None] * 8,
-        [None] * 8,
-        [None] * 8,
-        [None] * 8,
-        [Piece('pawn', 'white', (6, i)) for i in range(8)],
-        [Piece('rook', 'white', (7, 0)), Piece('knight', 'white', (7, 1)), Piece('bishop', 'white', (7, 2)), Piece('queen', 'white', (7, 3)), Piece('king', 'white', (7, 4)), Piece('bishop', 'white', (7, 5)), Piece('knight', 'white', (7, 6)), Piece('rook', 'white', (7, 7))]
-    ]
-    return board
-
 def get_piece_symbol(piece):
     """Get Unicode symbol for piece"""
     if not piece:
@@ -862,8 +512,12 @@ def make_ai_move():
     if st.session_state.turn == 'black' and not st.session_state.game_over:
         with st.spinner("🤖 AI is thinking..."):
             try:
-                uci_move = get_stockfish_move(st.session_state.board, st.session_state.turn, 
-                                            castling_rights, en_passant, halfmove_clock, fullmove_number)
+                # The opening book answers without any engine while in book
+                uci_move = get_book_move(st.session_state.board, st.session_state.last_move)
+                if uci_move is None:
+                    uci_move = get_stockfish_move(st.session_state.board, st.session_state.turn,
+                                                castling_rights, en_passant, halfmove_clock, fullmove_number,
+                                                st.session_state.last_move)
                 
                 if uci_move:
                     # Parse UCI move (e.g., 'e2e4')
@@ -875,37 +529,22 @@ def make_ai_move():
                     piece = st.session_state.board[start_row][start_col]
                     target_position = (end_row, end_col)
                     
-                    # Move piece
-                    piece.update_position(target_position)
-                    st.session_state.board[end_row][end_col] = piece
-                    st.session_state.board[start_row][start_col] = None
-                    
-                    # Handle castling
-                    if piece.piece_type == 'king' and abs(start_col - end_col) == 2:
-                        if end_col == 6:  # King-side castling
-                            rook_start_col = 7
-                            rook_end_col = 5
-                        elif end_col == 2:  # Queen-side castling
-                            rook_start_col = 0
-                            rook_end_col = 3
-                        
-                        rook_row = start_row
-                        rook = st.session_state.board[rook_row][rook_start_col]
-                        st.session_state.board[rook_row][rook_end_col] = rook
-                        rook.update_position((rook_row, rook_end_col))
-                        st.session_state.board[rook_row][rook_start_col] = None
-                    
                     # Record move with proper chess notation
                     from_pos = (start_row, start_col)
                     to_pos = (end_row, end_col)
-                    captured_piece = st.session_state.board[end_row][end_col] if st.session_state.board[end_row][end_col] else None
+                    captured_piece = st.session_state.board[end_row][end_col]
                     move_notation = get_chess_notation(piece, from_pos, to_pos, captured_piece)
                     if not hasattr(st.session_state, 'move_history'):
                         st.session_state.move_history = []
                     st.session_state.move_history.append(f"{len(st.session_state.move_history) + 1}. {move_notation}")
                     
                     # Update FEN state
-                    update_fen_state(st.session_state.board, target_position, piece, 'black')
+                    update_fen_state(st.session_state.board, from_pos, target_position, piece, 'black')
+                    
+                    # Move piece (make_move also moves the rook when castling)
+                    promotion = UCI_PROMOTIONS.get(uci_move[4:5], 'queen')
+                    make_move(st.session_state.board, (from_pos, target_position, promotion))
+                    st.session_state.last_move = (from_pos, target_position)
                     
                     st.session_state.turn = 'white'
                     
@@ -933,6 +572,8 @@ if 'board' not in st.session_state:
     st.session_state.selected_piece = None
     st.session_state.game_over = False
     st.session_state.move_history = []
+if 'engine_session' not in st.session_state:
+    st.session_state.engine_session = uuid.uuid4().hex
 
 
 # Create three columns for the cute layout
@@ -947,6 +588,7 @@ with col1:
     
     # New Game button
     if st.button("🔄 New Game", use_container_width=True, key="new_game_left"):
+        cancel_requests(st.session_state.engine_session)
         st.session_state.board = initialize_board()
         st.session_state.turn = 'white'
         st.session_state.last_move = None
@@ -982,7 +624,7 @@ with col2:
                 elif st.session_state.selected_piece:
                     selected_row, selected_col = st.session_state.selected_piece
                     selected_piece = st.session_state.board[selected_row][selected_col]
-                    valid_moves = get_valid_moves(selected_piece, st.session_state.board, st.session_state.last_move)
+                    valid_moves = get_valid_moves(st.session_state.board, st.session_state.selected_piece, st.session_state.last_move)
                     if (row, col) in valid_moves:
                         square_color = "#90EE90"
                         button_style = "border: 2px solid #00AA00 !important; box-shadow: 0 0 5px rgba(0, 170, 0, 0.3) !important;"
@@ -1023,45 +665,26 @@ with col2:
                                 st.rerun()
                             else:
                                 # Try to move to this square
-                                valid_moves = get_valid_moves(selected_piece, st.session_state.board, st.session_state.last_move)
+                                valid_moves = get_valid_moves(st.session_state.board, (selected_row, selected_col), st.session_state.last_move)
                                 if (row, col) in valid_moves:
-                                    # Make the move
-                                    st.session_state.board[row][col] = selected_piece
-                                    st.session_state.board[selected_row][selected_col] = None
-                                    selected_piece.update_position((row, col))
-                                    
-                                    # Handle castling
-                                    if selected_piece.piece_type == 'king' and abs(selected_col - col) == 2:
-                                        if col > selected_col:  # King-side castling
-                                            rook = st.session_state.board[row][7]
-                                            if can_castle(st.session_state.board, selected_piece, rook):
-                                                st.session_state.board[row][5] = rook
-                                                rook.update_position((row, 5))
-                                                st.session_state.board[row][7] = None
-                                        else:  # Queen-side castling
-                                            rook = st.session_state.board[row][0]
-                                            if can_castle(st.session_state.board, selected_piece, rook):
-                                                st.session_state.board[row][3] = rook
-                                                rook.update_position((row, 3))
-                                                st.session_state.board[row][0] = None
-                                    
-
-                                    
                                     # Record move with proper chess notation
                                     from_pos = (selected_row, selected_col)
                                     to_pos = (row, col)
-                                    captured_piece = st.session_state.board[row][col] if st.session_state.board[row][col] else None
+                                    captured_piece = st.session_state.board[row][col]
                                     move_notation = get_chess_notation(selected_piece, from_pos, to_pos, captured_piece)
                                     if not hasattr(st.session_state, 'move_history'):
                                         st.session_state.move_history = []
                                     st.session_state.move_history.append(f"{len(st.session_state.move_history) + 1}. {move_notation}")
                                     
+                                    # Update FEN state
+                                    update_fen_state(st.session_state.board, from_pos, to_pos, selected_piece, 'white')
+                                    
+                                    # Make the move (make_move also handles castling, en passant and promotion)
+                                    make_move(st.session_state.board, (from_pos, to_pos))
+                                    
                                     st.session_state.last_move = ((selected_row, selected_col), (row, col))
                                     st.session_state.turn = 'black'
                                     
-                                    # Update FEN state
-                                    update_fen_state(st.session_state.board, (row, col), selected_piece, 'white')
-                                    
                                     # Check for game over
                                     if is_checkmate(st.session_state.board, st.session_state.turn):
                                         st.session_state.game_over = True
@@ -1099,7 +722,7 @@ with col3:
         piece = st.session_state.board[row][col]
         st.write(f"**Selected:** {get_piece_symbol(piece)} {piece.piece_type.title()} at {chr(97 + col)}{8 - row}")
         
-        valid_moves = get_valid_moves(piece, st.session_state.board, st.session_state.last_move)
+        valid_moves = get_valid_moves(st.session_state.board, (row, col), st.session_state.last_move)
         st.write(f"**Valid moves:** {len(valid_moves)}")
         for move in valid_moves[:5]:  # Show first 5 moves
             st.write(f"• {chr(97 + move[1])}{8 - move[0]}")
@@ -0,0 +1,105 @@
+# Syzygy endgame tablebases for the built-in search, read through
+# python-chess's chess.syzygy. With few enough pieces on the board the tables
+# give the exact result, so the search stops guessing: at the root the move
+# is picked from the DTZ tables (fastest safe progress towards the best
+# result), and inside the tree a WDL probe ends the branch with a win, draw
+# or loss score. Tables only cover positions without castling rights.
+#
+# Install the .rtbw/.rtbz files in SYZYGY_DIR; without them nothing changes.
+# Each front end hands its Tablebase to chess_ai.tablebase.
+import functools
+import os
+
+import chess
+import chess.syzygy
+
+from chess_logic import board_to_fen, generate_legal_moves, is_in_check, make_move, unmake_move
+from bitboard import popcount
+
+# Directory holding the Syzygy files; set TITAN_SYZYGY to point elsewhere
+SYZYGY_DIR = os.environ.get('TITAN_SYZYGY', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'syzygy'))
+
+# Most pieces, kings included, a position may have to be probed; lowered to
+# the largest table actually installed
+SYZYGY_PROBE_LIMIT = 6
+
+class Tablebase:
+    """Probes for the built-in search over tables (a chess.syzygy.Tablebase,
+    opened from directory unless given)"""
+    def __init__(self, directory=SYZYGY_DIR, probe_limit=SYZYGY_PROBE_LIMIT, tables=None):
+        self.directory = directory
+        self.tables = tables if tables is not None else chess.syzygy.open_tablebase(directory)
+        # Table names like KQvKR list every piece, plus the 'v'
+        largest = max((len(name) - 1 for name in self.tables.wdl), default=0)
+        self.max_pieces = min(probe_limit, largest)
+        self.probes = 0
+        self.hits = 0
+
+    def covers(self, board):
+        """Whether board is small enough to probe and has no castling rights"""
+        return popcount(board.occupied) <= self.max_pieces and not board.castling_rights
+
+    def _chess_board(self, board):
+        en_passant = '-'
+        if board.en_passant_file is not None:
+            en_passant = 'abcdefgh'[board.en_passant_file] + ('6' if board.turn == 'white' else '3')
+        return chess.Board(board_to_fen(board, board.turn, '-', en_passant))
+
+    def probe_wdl(self, board):
+        """Win (2), cursed win (1), draw (0), blessed loss (-1) or loss (-2)
+        for board.turn, or None when the position isn't in the tables"""
+        if not self.covers(board):
+            return None
+        self.probes += 1
+        wdl = self.tables.get_wdl(self._chess_board(board))
+        if wdl is not None:
+            self.hits += 1
+        return wdl
+
+    def root_move(self, board, last_move=None):
+        """(move, wdl) for board.turn straight from the tables, or None
+
+        Keeps the best result the position allows and, among moves that do,
+        mates at once if it can, else plays the one that reaches the next
+        capture or pawn move soonest when winning and puts it off longest
+        when losing; a capture or pawn move counts as reaching it.
+        """
+        if not self.covers(board):
+            return None
+        enemy = 'black' if board.turn == 'white' else 'white'
+        best, best_key = None, None
+        for move in generate_legal_moves(board, board.turn, last_move):
+            undo = make_move(board, move)
+            try:
+                mate = is_in_check(board, enemy) and not generate_legal_moves(board, enemy, move)
+                child = self._chess_board(board)
+                wdl = self.tables.get_wdl(child)
+                dtz = self.tables.get_dtz(child)
+            finally:
+                unmake_move(board, undo)
+            if wdl is None or dtz is None:
+                return None
+            # The child's result is the opponent's
+            wdl, dtz = -wdl, -dtz
+            zeroing = undo[3] is not None or undo[0].piece_type == 'pawn'
+            if wdl > 0:
+                key = (wdl, mate, zeroing, -abs(dtz))
+            else:
+                key = (wdl, False, not zeroing, abs(dtz))
+            if best_key is None or key > best_key:
+                best, best_key = (move, wdl), key
+        return best
+
+    def close(self):
+        self.tables.close()
+
+@functools.lru_cache(maxsize=None)
+def get_tablebase():
+    """The Tablebase in SYZYGY_DIR, or None when no tables are installed there; opened once per process"""
+    if not os.path.isdir(SYZYGY_DIR):
+        return None
+    tablebase = Tablebase(SYZYGY_DIR)
+    if not tablebase.max_pieces:
+        tablebase.close()
+        return None
+    return tablebase
@@ -1,4 +1,22 @@
+import asyncio
 import copy
+import pickle
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+
+import pytest
+
+import chess_ai
+import chess_logic
+import perft
+from analysis_cache import AnalysisCache
+from bitboard import popcount
+from psqt import PSQT, piece_value, KNIGHT_TABLE
+from transposition import TranspositionTable, SharedTranspositionTable, EXACT, LOWER, UPPER, detach_all
 
 # Copy the chess logic from the main file
 def is_within_boundaries(row,col):
@@ -189,5 +207,603 @@ def test_chess_logic():
     
     print("Chess logic test completed!")
 
+def place(pieces):
+    board = chess_logic.Position()
+    for piece_type, color, position in pieces:
+        board[position[0]][position[1]] = chess_logic.Piece(piece_type, color)
+    return board
+
+def snapshot(board):
+    return [[(p.piece_type, p.color) if p else None for p in row] for row in board], board.castling_rights
+
+def test_make_unmake_restores_board():
+    # Castling, en passant and promotion all have to come back exactly
+    board = place([('king', 'white', (7, 4)), ('rook', 'white', (7, 7)),
+                   ('king', 'black', (0, 4)), ('pawn', 'white', (3, 4)),
+                   ('pawn', 'black', (3, 3)), ('pawn', 'white', (1, 0)),
+                   ('knight', 'black', (0, 1))])
+    before = snapshot(board)
+
+    for move in [((7, 4), (7, 6)), ((3, 4), (2, 3)), ((1, 0), (0, 1), 'knight'), ((1, 0), (0, 0))]:
+        undo = chess_logic.make_move(board, move)
+        assert snapshot(board) != before
+        chess_logic.unmake_move(board, undo)
+        assert snapshot(board) == before
+
+    undo = chess_logic.make_move(board, ((7, 4), (7, 6)))
+    assert board[7][5].piece_type == 'rook' and board[7][7] is None
+    chess_logic.unmake_move(board, undo)
+    undo = chess_logic.make_move(board, ((3, 4), (2, 3)))
+    assert board[3][3] is None
+    chess_logic.unmake_move(board, undo)
+    undo = chess_logic.make_move(board, ((1, 0), (0, 1), 'knight'))
+    assert board[0][1].piece_type == 'knight' and board[0][1].color == 'white'
+    chess_logic.unmake_move(board, undo)
+    assert snapshot(board) == before
+
+def test_position_bitboards_follow_board_writes():
+    board = chess_logic.initialize_board()
+    assert board.pieces('white', 'pawn') == 0xFF << 48
+    assert board.king_square('black') == (0, 4)
+
+    undo = chess_logic.make_move(board, ((6, 4), (4, 4)))
+    assert board.pieces('white', 'pawn') == (0xFF << 48) & ~(1 << 52) | (1 << 36)
+    chess_logic.unmake_move(board, undo)
+    assert board.pieces('white', 'pawn') == 0xFF << 48
+
+    # Plain grid writes go through the same masks
+    board[7][4] = None
+    assert board.king_square('white') is None
+    assert chess_logic.board_to_fen(board, 'white').startswith('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQ1BNR w')
+
+def test_legal_moves_respect_pins_and_double_check():
+    # The e-file knight is pinned by the rook and cannot move at all
+    board = place([('king', 'white', (7, 4)), ('knight', 'white', (5, 4)),
+                   ('rook', 'black', (0, 4)), ('king', 'black', (0, 0))])
+    assert chess_logic.get_valid_moves(board, (5, 4)) == []
+
+    # Rook and knight both give check: only king moves remain
+    board = place([('king', 'white', (7, 4)), ('queen', 'white', (7, 0)),
+                   ('rook', 'black', (0, 4)), ('knight', 'black', (5, 3)), ('king', 'black', (0, 0))])
+    moves = chess_logic.generate_legal_moves(board, 'white')
+    assert moves and all(start == (7, 4) for start, end in moves)
+
+def test_attack_detection_looks_outward_from_square():
+    board = place([('king', 'white', (7, 4)), ('rook', 'white', (7, 7)),
+                   ('pawn', 'black', (6, 6)), ('king', 'black', (0, 4))])
+    # The black pawn covers f1, so white may not castle through it
+    assert chess_logic.is_square_attacked(board, (7, 5), 'black')
+    assert chess_logic.get_castling_moves(board, (7, 4)) == []
+    assert not chess_logic.is_in_check(board, 'white')
+    board[6][6] = None
+    assert chess_logic.get_castling_moves(board, (7, 4)) == [(7, 6)]
+
+def test_piece_lists_follow_captures_and_promotions():
+    board = place([('king', 'white', (7, 4)), ('pawn', 'white', (1, 0)),
+                   ('knight', 'black', (0, 1)), ('king', 'black', (0, 7))])
+    undo = chess_logic.make_move(board, ((1, 0), (0, 1)))
+    assert [(square, piece.piece_type) for square, piece in board.piece_list('black')] == [((0, 7), 'king')]
+    assert sorted((square, piece.piece_type) for square, piece in board.piece_list('white')) == [((0, 1), 'queen'), ((7, 4), 'king')]
+    chess_logic.unmake_move(board, undo)
+    assert sorted(board.piece_squares('black')) == [(0, 1), (0, 7)]
+    assert board.king_square('white') == (7, 4)
+
+def test_pieces_are_shared_and_castling_rights_live_on_the_board():
+    board = chess_logic.initialize_board()
+    assert board[7][0] is board[7][7] is chess_logic.Piece('rook', 'white')
+    assert copy.deepcopy(board)[7][0] is board[7][0]
+    assert pickle.loads(pickle.dumps(board))[0][4] is chess_logic.Piece('king', 'black')
+
+    board[6][7] = None
+    first = chess_logic.make_move(board, ((7, 7), (5, 7)))
+    assert board.castling_rights == 'Qkq'
+    second = chess_logic.make_move(board, ((5, 7), (7, 7)))
+    assert board.castling_rights == 'Qkq'
+    chess_logic.unmake_move(board, second)
+    chess_logic.unmake_move(board, first)
+    assert board.castling_rights == 'KQkq'
+
+def test_perft_matches_reference_counts():
+    for name, fen, counts in perft.REFERENCE_POSITIONS:
+        board, turn, last_move = chess_logic.board_from_fen(fen)
+        assert perft.perft(board, turn, 2, last_move) == counts[2], name
+    board, turn, last_move = chess_logic.board_from_fen('rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3')
+    assert last_move == ((1, 5), (3, 5))
+    assert perft.divide(board, turn, 1, last_move)['e5f6'] == 1
+
+def test_zobrist_key_follows_moves_and_transpositions():
+    board = chess_logic.initialize_board()
+    start_key = board.zobrist
+    for move in [((7, 6), (5, 5)), ((0, 6), (2, 5)), ((5, 5), (7, 6)), ((2, 5), (0, 6))]:
+        chess_logic.make_move(board, move)
+    assert board.zobrist == start_key
+    chess_logic.make_move(board, ((6, 4), (4, 4)))
+    assert board.turn == 'black' and board.en_passant_file is None
+    assert board.zobrist == board.compute_zobrist() != start_key
+
+    board, turn, last_move = chess_logic.board_from_fen('4k3/8/8/8/5p2/8/4P3/4K3 w - - 0 1')
+    before = board.zobrist
+    undo = chess_logic.make_move(board, ((6, 4), (4, 4)))
+    assert board.en_passant_file == 4
+    assert board.zobrist == board.compute_zobrist()
+    assert board.zobrist == chess_logic.board_from_fen('4k3/8/8/8/4Pp2/8/8/4K3 b - e3 0 1')[0].zobrist
+    chess_logic.unmake_move(board, undo)
+    assert board.zobrist == before and board.turn == 'white'
+
+def test_transposition_table_buckets_and_stats():
+    table = TranspositionTable(1)
+    assert table.size & table.mask == 0 and 2 * table.size * 256 <= 1024 * 1024
+    key, other = 12345, 12345 + table.size  # same bucket, different positions
+    assert table.probe(key) is None
+    table.store(key, 4, EXACT, 10, ((6, 4), (4, 4)))
+    table.store(other, 2, LOWER, -5, None)  # shallower: goes to the always-replace slot
+    assert table.probe(key)[1:] == (4, EXACT, 10, ((6, 4), (4, 4)))
+    assert table.probe(other)[3] == -5
+    table.store(other, 6, EXACT, 1, None)  # deeper: takes the depth-preferred slot
+    assert table.probe(other)[1] == 6
+    stats = table.stats()
+    assert stats['probes'] == 4 and stats['hits'] == 3 and stats['hit_rate'] == 0.75
+    table.clear()
+    assert table.probe(other) is None and table.stats()['entries'] == 0
+
+def test_iterative_deepening_stops_within_budget():
+    board, turn, last_move = chess_logic.board_from_fen('r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4')
+    before = snapshot(board), board.zobrist
+    chess_ai.transposition_table.clear()
+    move, score, depth = chess_ai.iterative_deepening(board, turn, last_move, node_limit=300)
+    assert depth >= 1 and move in chess_logic.generate_legal_moves(board, turn, last_move)
+    assert (snapshot(board), board.zobrist) == before
+
+    # Depth 1 always finishes, so even a spent budget returns a move
+    move, score, depth = chess_ai.iterative_deepening(board, turn, last_move, node_limit=1)
+    assert depth == 1 and move is not None
+
+def test_move_ordering_tries_tt_move_captures_then_killers():
+    board = place([('king', 'white', (7, 4)), ('queen', 'white', (4, 4)), ('pawn', 'white', (5, 2)),
+                   ('rook', 'black', (4, 3)), ('queen', 'black', (1, 4)), ('king', 'black', (0, 7))])
+    moves = chess_logic.get_all_valid_moves(board, 'white')
+    quiet = ((7, 4), (7, 5))
+    ordering = chess_ai.MoveOrdering()
+    ordering.record_cutoff(board, quiet, 2, 3)
+    ordered = chess_ai.order_moves(board, moves, tt_move=((4, 4), (5, 4)), ply=3, ordering=ordering)
+    assert ordered[0] == ((4, 4), (5, 4))
+    # Queen takes queen beats queen takes rook; pawn takes rook beats queen takes rook
+    assert ordered[1:4] == [((4, 4), (1, 4)), ((5, 2), (4, 3)), ((4, 4), (4, 3))]
+    assert ordered[4] == quiet
+    assert sorted(ordered) == sorted(moves)
+    # Each search learns its own killers
+    assert chess_ai.SearchLimits().ordering.killers[3] == [None, None]
+    assert chess_ai.order_moves(board, moves, ply=3, ordering=chess_ai.MoveOrdering())[4] != quiet
+
+    # En passant is a capture: ordered with them and never a killer
+    board, turn, last_move = chess_logic.board_from_fen('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1')
+    en_passant = ((3, 4), (2, 3))
+    ordering = chess_ai.MoveOrdering()
+    ordering.record_cutoff(board, en_passant, 2, 0)
+    assert ordering.killers[0] == [None, None] and not ordering.history
+    assert chess_ai.order_moves(board, chess_logic.generate_legal_moves(board, turn, last_move))[0] == en_passant
+
+def test_quiescence_sees_the_recapture_at_the_horizon():
+    # Qxd5 wins a pawn at depth 1 unless the search looks at ...exd5
+    board, turn, last_move = chess_logic.board_from_fen('6k1/8/4p3/3p4/8/8/8/3Q2K1 w - - 0 1')
+    chess_ai.USE_QUIESCENCE = False
+    try:
+        assert chess_ai.iterative_deepening(board, turn, last_move, max_depth=1)[0] == ((7, 3), (3, 3))
+    finally:
+        chess_ai.USE_QUIESCENCE = True
+    assert chess_ai.iterative_deepening(board, turn, last_move, max_depth=1)[0] != ((7, 3), (3, 3))
+    assert chess_ai.capture_moves(board, 'black') == []
+    assert chess_ai.capture_moves(board, 'white') == [((7, 3), (3, 3))]
+
+def test_negamax_finds_mate_with_each_pruning_switch_off():
+    board, turn, last_move = chess_logic.board_from_fen('6k1/5ppp/8/8/8/8/r4PPP/6K1 b - - 0 1')
+    key = board.zobrist
+    undo = chess_logic.make_null_move(board)
+    assert board.turn == 'white' and board.zobrist != key
+    chess_logic.unmake_null_move(board, undo)
+    assert board.zobrist == key
+
+    for switch in (None, 'USE_PVS', 'USE_NULL_MOVE', 'USE_LMR'):
+        if switch:
+            setattr(chess_ai, switch, False)
+        try:
+            chess_ai.transposition_table.clear()
+            move, score, depth = chess_ai.iterative_deepening(board, turn, last_move, max_depth=3)
+        finally:
+            if switch:
+                setattr(chess_ai, switch, True)
+        # ...Ra1# scores as a mate for black, one ply from the root
+        assert move == ((6, 0), (7, 0)) and score == -(chess_ai.MATE_SCORE - 1)
+    assert board.zobrist == key
+
+def test_psqt_score_is_kept_by_make_and_unmake():
+    def recount(board):
+        return sum(PSQT[(piece.color, piece.piece_type)][row * 8 + col]
+                   for color in ('white', 'black') for (row, col), piece in board.piece_list(color))
+    board, turn, last_move = chess_logic.board_from_fen('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1')
+    assert PSQT[('black', 'knight')][1] == -PSQT[('white', 'knight')][57] == -(piece_value['knight'] + KNIGHT_TABLE[7][1])
+    before = board.psqt_score
+    assert before == recount(board)
+    undos = []
+    for move in [((6, 6), (4, 6)), ((6, 1), (7, 0), 'knight'), ((4, 6), (3, 6))]:
+        undos.append(chess_logic.make_move(board, move))
+        assert board.psqt_score == recount(board)
+    for undo in reversed(undos):
+        chess_logic.unmake_move(board, undo)
+    assert board.psqt_score == before
+    assert chess_logic.initialize_board().psqt_score == 0
+
+def test_mobility_from_attack_masks_matches_move_generation():
+    for name, fen, _ in perft.REFERENCE_POSITIONS:
+        board, turn, last_move = chess_logic.board_from_fen(fen)
+        for color in ('white', 'black'):
+            moves = sum(len(piece.get_moves(board, square, None)) for square, piece in board.piece_list(color))
+            assert chess_ai.side_activity(board, color)[0] == moves, name
+
+    # Black's queen and knight both hit the squares around the white king
+    board, turn, last_move = chess_logic.board_from_fen('4k3/8/8/8/8/3n4/4q3/4K3 w - - 0 1')
+    assert chess_ai.side_activity(board, 'black')[1] == 5 + 2
+    terms = chess_ai.evaluation_terms(board)
+    chess_ai.USE_KING_ZONE = True
+    chess_ai.eval_cache.clear()
+    try:
+        assert chess_ai.evaluate_board(board) == sum(terms.values())
+    finally:
+        chess_ai.USE_KING_ZONE = False
+        chess_ai.eval_cache.clear()
+    assert chess_ai.evaluate_board(board) == sum(terms.values()) - terms['king_zone']
+
+def test_pawn_structure_and_evaluation_caches():
+    # White: doubled and isolated c-pawns, passed a-pawn on the 6th; black: a lone h-pawn
+    board, turn, last_move = chess_logic.board_from_fen('4k3/7p/P7/8/2P5/2P5/8/4K3 w - - 0 1')
+    assert chess_ai.pawn_structure(board, 'white') == (
+        -chess_ai.DOUBLED_PAWN_PENALTY - 3 * chess_ai.ISOLATED_PAWN_PENALTY + chess_ai.PASSED_PAWN_BONUS[5] + chess_ai.PASSED_PAWN_BONUS[3] + chess_ai.PASSED_PAWN_BONUS[2])
+    assert chess_ai.pawn_structure(board, 'black') == -chess_ai.ISOLATED_PAWN_PENALTY + chess_ai.PASSED_PAWN_BONUS[1]
+
+    chess_ai.eval_cache.clear()
+    chess_ai.pawn_cache.clear()
+    score = chess_ai.evaluate_board(board)
+    pawn_key = board.pawn_zobrist
+    undo = chess_logic.make_move(board, ((7, 4), (7, 3)))  # a king move keeps the pawn key
+    assert board.pawn_zobrist == pawn_key
+    chess_ai.evaluate_board(board)
+    assert chess_ai.pawn_cache.stats()['hits'] == 1
+    chess_logic.unmake_move(board, undo)
+    assert chess_ai.evaluate_board(board) == score
+    assert chess_ai.eval_cache.stats()['hits'] == 1 and chess_ai.eval_cache.stats()['hit_rate'] == 1 / 3
+
+def test_static_exchange_resolves_recaptures_and_x_rays():
+    def see(fen, move):
+        board = chess_logic.board_from_fen(fen)[0]
+        return chess_ai.static_exchange(board, move)
+    assert see('4k3/8/2p5/3p4/8/8/8/3RK3 w - - 0 1', ((7, 3), (3, 3))) == 100 - 500
+    assert see('4k3/8/4p3/3n4/4P3/8/8/4K3 w - - 0 1', ((4, 4), (3, 3))) == 320 - 100
+    # The second rook behind the first makes Rxd5 safe against a single defender
+    assert see('3rk3/8/8/3p4/8/8/3R4/3RK3 w - - 0 1', ((6, 3), (3, 3))) == 100
+    assert see('3rk3/8/8/3p4/8/8/3Q4/3RK3 w - - 0 1', ((6, 3), (3, 3))) == 100 - 900 + 500
+    assert see('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1', ((3, 4), (2, 3))) == 100
+
+    board = chess_logic.board_from_fen('4k3/8/2p5/3p4/8/8/8/3RK3 w - - 0 1')[0]
+    ordered = chess_ai.order_moves(board, chess_logic.get_all_valid_moves(board, 'white'))
+    assert ordered[-1] == ((7, 3), (3, 3))
+
+def test_parallel_search_matches_serial_and_is_reproducible():
+    board, turn, last_move = chess_logic.board_from_fen(perft.REFERENCE_POSITIONS[1][1])
+    before = [list(row) for row in board]
+    try:
+        serial = chess_ai.search(board, chess_ai.SearchLimits(max_depth=2), last_move, deterministic=True)
+        limits = chess_ai.SearchLimits(max_depth=2)
+        first = chess_ai.search(board, limits, last_move, workers=2, deterministic=True)
+        second = chess_ai.search(board, chess_ai.SearchLimits(max_depth=2), last_move, workers=2, deterministic=True)
+    finally:
+        chess_ai.shutdown_pool()
+    assert first == second == serial
+    assert first in chess_logic.generate_legal_moves(board, turn, last_move)
+    assert limits.nodes > 0
+    assert [list(row) for row in board] == before
+
+    # A script that never calls shutdown_pool() still exits cleanly
+    script = ('import chess_ai, chess_logic; '
+              'chess_ai.search(chess_logic.initialize_board(), chess_ai.SearchLimits(max_depth=1), workers=2)')
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0 and result.stderr == ''
+
+def _store_in_worker(table, key):
+    table.store(key, 4, 0, -250, ((1, 0), (0, 0), 'knight'))
+
+def test_shared_transposition_table_is_seen_across_processes():
+    table = SharedTranspositionTable(1)
+    try:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            pool.submit(_store_in_worker, table, 0xDEADBEEFCAFEF00D).result()
+        assert table.probe(0xDEADBEEFCAFEF00D) == (0xDEADBEEFCAFEF00D, 4, 0, -250, ((1, 0), (0, 0), 'knight'))
+        # A shallower entry for another key in the same bucket goes to the always-replace slot
+        other = 0xDEADBEEFCAFEF00D ^ (table.size << 3)
+        table.store(other, 2, LOWER, 10, None)
+        assert table.probe(other) == (other, 2, LOWER, 10, None)
+        assert table.probe(0xDEADBEEFCAFEF00D)[1] == 4
+        # A write torn between two processes fails the XOR check and reads as a miss
+        table.words[(other & table.mask) * 4 + 2] ^= 1
+        assert table.probe(other) is None
+        table.store(other, 1, UPPER, 0, None)
+        table.clear()
+        assert table.stats()['entries'] == 0
+        # Unpickled copies attach once per process and are closed together
+        attached = pickle.loads(pickle.dumps(table))
+        assert pickle.loads(pickle.dumps(table)) is attached and not attached.owner
+        detach_all()
+        assert pickle.loads(pickle.dumps(table)) is not attached
+        detach_all()
+
+        board, turn, last_move = chess_logic.board_from_fen(perft.REFERENCE_POSITIONS[2][1])
+        assert perft.perft(board, turn, 3, last_move, table) == 2812
+        assert perft.perft(board, turn, 3, last_move, table) == 2812
+        assert table.stats()['hits'] > 0
+    finally:
+        table.close()
+    board, turn, last_move = chess_logic.board_from_fen(perft.REFERENCE_POSITIONS[0][1])
+    assert sum(perft.parallel_divide(board, turn, 3, last_move, workers=2, hash_mb=1).values()) == 8902
+
+def test_engine_pool_reuses_engines_and_replaces_crashed_ones():
+    pytest.importorskip('chess.engine')
+    import chess.engine
+    import engine_pool
+
+    class FakeEngine:
+        def __init__(self, path):
+            self.alive = True
+            self.searches = 0
+        def ping(self):
+            if not self.alive:
+                raise chess.engine.EngineTerminatedError("engine process died")
+        def play(self, board, limit):
+            self.ping()
+            self.searches += 1
+            return chess.engine.PlayResult(next(iter(board.legal_moves)), None)
+        def close(self):
+            self.alive = False
+        quit = close
+
+    opened = []
+    def open_engine(path):
+        opened.append(FakeEngine(path))
+        return opened[-1]
+
+    pool = engine_pool.EnginePool('stockfish', size=1, open_engine=open_engine)
+    fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+    limit = chess.engine.Limit(time=0.01)
+    assert pool.play(fen, limit) and pool.play(fen, limit)
+    assert len(opened) == 1 and opened[0].searches == 2
+    opened[0].alive = False  # crashed between moves: the ping catches it
+    assert pool.play(fen, limit)
+    assert len(opened) == 2 and pool.stats()['restarts'] == 1
+    # Any other failure still hands the slot back, with a fresh engine next time
+    def fail(board, limit):
+        raise ValueError("unexpected reply from engine")
+    opened[1].play = fail
+    with pytest.raises(ValueError):
+        pool.play(fen, limit)
+    assert pool.idle.qsize() == 1 and not opened[1].alive
+    assert pool.play(fen, limit) and len(opened) == 3
+    pool.close()
+    assert not opened[2].alive
+
+def test_engine_service_queues_cancels_and_rejects():
+    pytest.importorskip('chess.engine')
+    import chess
+    import chess.engine
+    import engine_pool
+
+    class FakeProtocol:
+        def __init__(self):
+            self.returncode = asyncio.get_running_loop().create_future()
+            self.stopped = 0
+        async def play(self, board, limit):
+            try:
+                await asyncio.sleep(limit.time)
+            except asyncio.CancelledError:
+                self.stopped += 1
+                raise
+            return chess.engine.PlayResult(next(iter(board.legal_moves)), None)
+        async def quit(self):
+            self.returncode.set_result(0)
+
+    opened = []
+    async def popen(path):
+        opened.append(FakeProtocol())
+        return None, opened[-1]
+
+    service = engine_pool.EngineService('stockfish', size=1, queue_size=2, popen=popen)
+    fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+    try:
+        assert service.submit(fen, 0.01).result(5)
+        running = service.submit(fen, 0.5, session='reset-me')
+        time.sleep(0.1)  # picked up by the worker; two more fill the queue
+        queued = [service.submit(fen, 0.01, session='reset-me'), service.submit(fen, 0.01)]
+        with pytest.raises(engine_pool.EngineBusy):
+            service.submit(fen, 0.01)
+        service.cancel_session('reset-me')
+        for future in (running, queued[0]):
+            with pytest.raises(CancelledError):
+                future.result(5)
+        assert queued[1].result(5)
+        stats = service.stats()
+        assert stats['rejected'] == 1 and stats['cancelled'] == 2 and stats['completed'] == 2
+        assert stats['queued'] == 0 and opened[0].stopped == 1
+    finally:
+        service.close()
+    assert opened[0].returncode.done()
+
+def test_engine_service_survives_unexpected_engine_errors():
+    pytest.importorskip('chess.engine')
+    import chess
+    import chess.engine
+    import engine_pool
+
+    class FlakyProtocol:
+        def __init__(self):
+            self.returncode = asyncio.get_running_loop().create_future()
+            self.calls = 0
+        async def play(self, board, limit):
+            self.calls += 1
+            if self.calls == 1:
+                raise ValueError("engine rejected the position")
+            return chess.engine.PlayResult(next(iter(board.legal_moves)), None)
+        async def quit(self):
+            self.returncode.set_result(0)
+
+    async def popen(path):
+        return None, FlakyProtocol()
+
+    service = engine_pool.EngineService('stockfish', size=1, popen=popen)
+    fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+    try:
+        with pytest.raises(ValueError):
+            service.submit(fen, 0.01).result(5)
+        # The worker is still there to answer the next request
+        assert service.submit(fen, 0.01).result(5)
+        assert service.stats()['failed'] == 1 and service.stats()['completed'] == 1
+    finally:
+        service.close()
+
+def test_analysis_cache_lru_and_persistence(tmp_path):
+    path = str(tmp_path / 'analysis.sqlite3')
+    start = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+    cache = AnalysisCache(size=2, path=path)
+    assert cache.get(start, 'stockfish time=0.1') is None
+    cache.put(start, 'stockfish time=0.1', 'e2e4')
+    # The move counters are not part of the key; the limits are
+    assert cache.get(start.replace('0 1', '4 9'), 'stockfish time=0.1') == 'e2e4'
+    assert cache.get(start, 'stockfish time=1.0') is None
+    board = chess_logic.initialize_board()
+    cache.put(board.zobrist, 'titan time=2.0', 'd2d4')
+    cache.put(0x1234, 'titan time=2.0', 'g1f3')  # pushes the FEN entry out of memory
+    assert cache.stats()['entries'] == 2
+    cache.close()
+
+    reopened = AnalysisCache(size=2, path=path)
+    assert reopened.get(start, 'stockfish time=0.1') == 'e2e4'
+    assert reopened.get(chess_logic.initialize_board().zobrist, 'titan time=2.0') == 'd2d4'
+    assert reopened.get(chess_logic.initialize_board().zobrist, 'titan time=2.0') == 'd2d4'
+    stats = reopened.stats()
+    assert (stats['hits'], stats['disk_hits'], stats['misses']) == (1, 2, 0)
+    reopened.clear()
+    assert reopened.get(start, 'stockfish time=0.1') is None
+    reopened.close()
+
+    # An unwritable location leaves the cache working in memory
+    blocked = tmp_path / 'not-a-directory'
+    blocked.write_text('')
+    fallback = AnalysisCache(size=2, path=str(blocked / 'analysis.sqlite3'))
+    assert fallback.db is None
+    fallback.put(start, 'stockfish time=0.1', 'e2e4')
+    assert fallback.get(start, 'stockfish time=0.1') == 'e2e4'
+
+def test_opening_book_keys_and_probing(tmp_path):
+    pytest.importorskip('chess.polyglot')
+    from opening_book import polyglot_key, OpeningBook, ENTRY
+
+    # Reference keys from the Polyglot book format description
+    board = chess_logic.initialize_board()
+    keys = [polyglot_key(board)]
+    last_move = None
+    for move in [((6, 4), (4, 4)), ((1, 3), (3, 3)), ((4, 4), (3, 4)), ((1, 5), (3, 5))]:
+        chess_logic.make_move(board, move)
+        last_move = move
+        keys.append(polyglot_key(board))
+    assert keys == [0x463b96181691fc9c, 0x823c9b50fd114196, 0x0756b94461c50fb0,
+                    0x662fafb965db29d4, 0x22a48b5a8e47ff78]
+
+    def encode(start, end):
+        return (7 - start[0]) << 9 | start[1] << 6 | (7 - end[0]) << 3 | end[1]
+    start_key = keys[0]
+    entries = [(start_key, encode((6, 4), (4, 4)), 10, 0), (start_key, encode((6, 3), (4, 3)), 30, 0),
+               (start_key, encode((6, 3), (3, 3)), 50, 0)]  # the last one is illegal and skipped
+    entries += [(random.getrandbits(64), 0, 1, 0) for _ in range(1000)]
+    path = tmp_path / 'book.bin'
+    path.write_bytes(b''.join(ENTRY.pack(*entry) for entry in sorted(entries)))
+    book = OpeningBook(str(path))
+    start = chess_logic.initialize_board()
+    assert book.moves(start) == [(((6, 3), (4, 3)), 30), (((6, 4), (4, 4)), 10)]
+    assert book.choose(start, selection='best') == ((6, 3), (4, 3))
+    assert book.choose(start, selection='weighted', rng=random.Random(1)) in {((6, 3), (4, 3)), ((6, 4), (4, 4))}
+    assert book.choose(board, last_move) is None
+    book.close()
+
+def test_search_uses_tablebase_at_root_and_interior_nodes():
+
+    class KQvKTables:
+        # Stand-in for tablebase.Tablebase: three pieces is a win for white
+        max_pieces = 3
+        def __init__(self):
+            self.probes = 0
+        def covers(self, board):
+            return popcount(board.occupied) <= self.max_pieces and not board.castling_rights
+        def probe_wdl(self, board):
+            self.probes += 1
+            return 2 if board.turn == 'white' else -2
+        def root_move(self, board, last_move=None):
+            if not self.covers(board):
+                return None
+            return chess_logic.generate_legal_moves(board, board.turn, last_move)[-1], 2
+
+    board, turn, last_move = chess_logic.board_from_fen('4k3/8/8/8/3r4/8/3Q4/4K3 w - - 0 1')
+    tables = KQvKTables()
+    saved = chess_ai.tablebase
+    chess_ai.tablebase = tables
+    try:
+        chess_ai.clear_search_state()
+        score, move = chess_ai.negamax(board, 2, -chess_ai.MATE_SCORE, chess_ai.MATE_SCORE, 'white', last_move)
+        assert move == ((6, 3), (4, 3)) and score == chess_ai.TB_WIN
+        assert tables.probes > 0
+
+        endgame, _, _ = chess_logic.board_from_fen('4k3/8/8/8/8/8/3Q4/4K3 w - - 0 1')
+        expected = chess_logic.generate_legal_moves(endgame, 'white')[-1]
+        assert chess_ai.search(endgame, chess_ai.SearchLimits(max_depth=3)) == expected
+    finally:
+        chess_ai.tablebase = saved
+        chess_ai.clear_search_state()
+
+def test_tablebase_ranks_root_moves_and_limits_probes():
+    pytest.importorskip('chess.syzygy')
+    import chess
+    from tablebase import Tablebase
+
+    class RookEndingTables:
+        # KRvK where only the rook on the h-file wins (faster from g1 than
+        # h1), b1 draws and every other move loses, scored for the side to move
+        wdl = {'KRvK': None}
+        def get_wdl(self, board):
+            rook = board.pieces(chess.ROOK, chess.WHITE)
+            if rook & (chess.BB_FILE_H | chess.BB_G1):
+                return -2
+            return 0 if chess.B1 in rook else 2
+        def get_dtz(self, board):
+            rook = board.pieces(chess.ROOK, chess.WHITE)
+            return -3 if chess.G1 in rook else {-2: -5, 0: 0, 2: 7}[self.get_wdl(board)]
+        def close(self):
+            pass
+
+    tables = Tablebase(probe_limit=6, tables=RookEndingTables())
+    assert tables.max_pieces == 3
+    board, turn, last_move = chess_logic.board_from_fen('k7/8/8/8/8/8/4K3/R7 w - - 0 1')
+    assert tables.covers(board) and tables.probe_wdl(board) == 2
+    assert tables.root_move(board, last_move) == (((7, 0), (7, 6)), 2)
+
+    # Drawing beats losing when no win is left
+    tables.tables.get_wdl = lambda child: 0 if chess.B1 in child.pieces(chess.ROOK, chess.WHITE) else 2
+    assert tables.root_move(board, last_move) == (((7, 0), (7, 1)), 0)
+
+    # Too many pieces, or castling rights, and the tables aren't probed
+    crowded = chess_logic.board_from_fen('k7/p7/8/8/8/8/4K3/R7 w - - 0 1')[0]
+    castling = chess_logic.board_from_fen('k7/8/8/8/8/8/8/R3K3 w Q - 0 1')[0]
+    for position in (crowded, castling):
+        assert not tables.covers(position)
+        assert tables.probe_wdl(position) is None and tables.root_move(position) is None
+
+    en_passant = chess_logic.board_from_fen('k7/8/8/3pP3/8/8/8/K7 w - d6 0 1')[0]
+    assert tables._chess_board(en_passant).fen() == 'k7/8/8/3pP3/8/8/8/K7 w - d6 0 1'
+
 if __name__ == "__main__":
     test_chess_logic() 
\ No newline at end of file
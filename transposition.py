@@ -0,0 +1,197 @@
+# Transposition table for the minimax search, indexed by the position's
+# Zobrist key (Position.zobrist). The table is a fixed number of buckets sized
+# from a megabyte budget, so memory stays flat however long a session runs.
+# Each bucket holds two entries: a depth-preferred slot, which only gives way
+# to a search at least as deep, and an always-replace slot for everything else.
+from multiprocessing import shared_memory, util
+
+from chess_logic import PROMOTION_TYPES
+
+# Bound types: EXACT scores are the true minimax value; a LOWER bound means the
+# search failed high (value >= score), an UPPER bound that it failed low.
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Rough CPython footprint of one stored entry: the (key, depth, bound, score,
+# move) tuple, the 64-bit key and the move it keeps alive
+ENTRY_BYTES = 256
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        buckets = max(1, size_mb * 1024 * 1024 // (2 * ENTRY_BYTES))
+        # Round down to a power of two so the bucket index is key & mask
+        self.size = 1 << (buckets.bit_length() - 1)
+        self.mask = self.size - 1
+        self.size_mb = size_mb
+        self.clear()
+
+    def clear(self):
+        self.depth_slots = [None] * self.size
+        self.always_slots = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def probe(self, key):
+        """The (key, depth, bound, score, move) entry stored for key, or None"""
+        self.probes += 1
+        index = key & self.mask
+        entry = self.depth_slots[index]
+        if entry is None or entry[0] != key:
+            entry = self.always_slots[index]
+            if entry is None or entry[0] != key:
+                return None
+        self.hits += 1
+        return entry
+
+    def store(self, key, depth, bound, score, move):
+        self.stores += 1
+        index = key & self.mask
+        entry = (key, depth, bound, score, move)
+        current = self.depth_slots[index]
+        if current is None or current[0] == key or depth >= current[1]:
+            self.depth_slots[index] = entry
+        else:
+            self.always_slots[index] = entry
+
+    def stats(self):
+        """Probe and hit counts since the last clear, with the hit rate and fill"""
+        filled = sum(entry is not None for entry in self.depth_slots)
+        filled += sum(entry is not None for entry in self.always_slots)
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'entries': filled,
+            'capacity': 2 * self.size,
+        }
+
+# --- Shared-memory table ---
+# The same two-slot buckets, packed into a multiprocessing.shared_memory block
+# so search and perft worker processes all read and write one table instead
+# of each warming up a private copy. An entry is two 64-bit words: the packed
+# data and the key XORed with that data. There are no locks; a reader only
+# trusts an entry whose check word XORs back to its own key, so an entry torn
+# by two processes writing at once just reads as a miss.
+#
+# Data word layout, low bits first: score (32 bits, offset to unsigned),
+# depth (8), bound (2), move from and to squares (6 + 6), promotion (3: none
+# or 1 + its index in PROMOTION_TYPES), has-move (1) and a used bit, so an
+# all-zero slot is always empty.
+BUCKET_WORDS = 4
+SCORE_OFFSET = 1 << 31
+USED_BIT = 1 << 58
+
+def _pack_move(move):
+    if move is None:
+        return 0
+    (from_row, from_col), (to_row, to_col) = move[0], move[1]
+    promotion = PROMOTION_TYPES.index(move[2]) + 1 if len(move) > 2 else 0
+    return 1 << 15 | promotion << 12 | (to_row * 8 + to_col) << 6 | from_row * 8 + from_col
+
+def _unpack_move(bits):
+    if not bits >> 15:
+        return None
+    start, end, promotion = bits & 63, bits >> 6 & 63, bits >> 12 & 7
+    move = ((start >> 3, start & 7), (end >> 3, end & 7))
+    return move + (PROMOTION_TYPES[promotion - 1],) if promotion else move
+
+class SharedTranspositionTable:
+    """TranspositionTable's interface over a named shared memory block
+
+    Create one in the parent process; pickling it (say, as an argument to a
+    ProcessPoolExecutor task) sends only its name, and the worker attaches to
+    the same memory. Probe/hit/store counts are per process. The creator calls
+    close() when done, which also frees the block.
+    """
+    def __init__(self, size_mb=16, name=None):
+        buckets = max(1, size_mb * 1024 * 1024 // (BUCKET_WORDS * 8))
+        self.size = 1 << (buckets.bit_length() - 1)
+        self.mask = self.size - 1
+        self.size_mb = size_mb
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.size * BUCKET_WORDS * 8)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.words = self.memory.buf.cast('Q')
+        if self.owner:
+            self.clear()
+        self.probes = self.hits = self.stores = 0
+
+    def __reduce__(self):
+        return (_attach, (self.size_mb, self.name))
+
+    def clear(self):
+        """Empty the table for every process attached to it"""
+        self.memory.buf[:] = bytes(self.memory.size)
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def _entry(self, key, offset):
+        data = self.words[offset]
+        if not data or self.words[offset + 1] ^ data != key:
+            return None
+        move = _unpack_move(data >> 42 & 0xFFFF)
+        return (key, data >> 32 & 0xFF, data >> 40 & 3, (data & 0xFFFFFFFF) - SCORE_OFFSET, move)
+
+    def probe(self, key):
+        """The (key, depth, bound, score, move) entry stored for key, or None"""
+        self.probes += 1
+        offset = (key & self.mask) * BUCKET_WORDS
+        entry = self._entry(key, offset) or self._entry(key, offset + 2)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def store(self, key, depth, bound, score, move):
+        self.stores += 1
+        offset = (key & self.mask) * BUCKET_WORDS
+        data = (USED_BIT | _pack_move(move) << 42 | bound << 40 | min(max(depth, 0), 255) << 32
+                | (score + SCORE_OFFSET) & 0xFFFFFFFF)
+        current = self.words[offset]
+        if current and self.words[offset + 1] ^ current != key and depth < (current >> 32 & 0xFF):
+            offset += 2
+        self.words[offset] = data
+        self.words[offset + 1] = key ^ data
+
+    def stats(self):
+        """Probe and hit counts for this process, with the hit rate and the shared fill"""
+        filled = sum(1 for data in self.words[::2] if data)
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'entries': filled,
+            'capacity': 2 * self.size,
+        }
+
+    def close(self):
+        """Detach from the block; the process that created it also frees it"""
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+# Tables this process has attached to, by name, so a table sent along with
+# every task is only mapped once per worker. They are closed when the process
+# exits - for a pool worker, when its pool shuts down.
+_attached = {}
+
+def _attach(size_mb, name):
+    table = _attached.get(name)
+    if table is None:
+        if not _attached:
+            # A finalizer rather than atexit: multiprocessing runs these as
+            # its worker processes exit, and drops any inherited at fork
+            util.Finalize(None, detach_all, exitpriority=0)
+        table = _attached[name] = SharedTranspositionTable(size_mb, name)
+    return table
+
+def detach_all():
+    """Close every table this process attached to"""
+    while _attached:
+        _attached.popitem()[1].close()